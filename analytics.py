@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized statistics over the whole reports history.
+
+Every function takes a reports DataFrame (as returned by
+`StorageBackend.load_reports`) and works on the error bit masks with NumPy,
+without splitting the error text row by row. Durations and throughput are
+computed from the epoch-second times, so no time string is parsed.
+"""
+import numpy as np
+import pandas as pd
+
+from config import ERROR_EVENTS_COLUMN, WORKING_HOURS_PER_DAY
+from error_codes import ERROR_NAMES, error_masks, mask_bits
+from timestamps import to_local
+
+
+def error_frequency(df):
+    """Number of reports in which each error was recorded, most frequent first."""
+    counts = mask_bits(error_masks(df)).sum(axis=0)
+    return pd.Series(counts, index=ERROR_NAMES, name="عدد التقارير").sort_values(ascending=False)
+
+
+def error_rates_by(df, column):
+    """
+    Share of reports with each error, per value of `column` (for example
+    "اسم المستخدم" or "رقم المركبة"). Rows are groups, columns are errors.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=ERROR_NAMES + ["عدد التقارير"])
+    bits = mask_bits(error_masks(df))
+    codes, groups = pd.factorize(df[column].fillna(""), sort=True)
+    totals = np.bincount(codes, minlength=len(groups))
+    sums = np.column_stack([np.bincount(codes, weights=bits[:, j], minlength=len(groups)) for j in range(bits.shape[1])])
+    rates = pd.DataFrame(sums / totals[:, None], index=pd.Index(groups, name=column), columns=ERROR_NAMES)
+    rates["عدد التقارير"] = totals
+    return rates
+
+
+def cooccurrence_matrix(df):
+    """
+    Number of reports in which each pair of errors was recorded together.
+    The diagonal holds the frequency of each error on its own.
+    """
+    bits = mask_bits(error_masks(df)).astype(np.float32)
+    # float32 keeps the product on the BLAS path and is exact up to 16 million reports
+    counts = np.rint(bits.T @ bits).astype(np.int64)
+    return pd.DataFrame(counts, index=ERROR_NAMES, columns=ERROR_NAMES)
+
+
+def error_timing(df):
+    """
+    When in the evaluation each error is recorded: number of events and the
+    median and 90th percentile minute after the start, per error. Only
+    reports saved with error events (see drafts.py) are counted.
+    """
+    columns = ["عدد المرات", "الدقيقة (الوسيط)", "الدقيقة (90%)"]
+    if ERROR_EVENTS_COLUMN not in df:
+        return pd.DataFrame(columns=columns)
+    events = df[ERROR_EVENTS_COLUMN].dropna()
+    events = events[events != ""].str.split(";").explode().str.split("@", expand=True)
+    if events.empty:
+        return pd.DataFrame(columns=columns)
+    codes = events[0].astype(np.int64).to_numpy()
+    minutes = events[1].astype(np.int64).to_numpy() / 60
+    grouped = pd.Series(minutes).groupby(pd.Categorical.from_codes(codes, ERROR_NAMES), observed=True)
+    timing = pd.DataFrame({
+        columns[0]: grouped.size(),
+        columns[1]: grouped.median(),
+        columns[2]: grouped.quantile(0.9)
+    }).round(1)
+    return timing.sort_values(columns[0], ascending=False)
+
+
+# ------------------------------
+# Durations and Utilisation
+# ------------------------------
+def durations_minutes(df):
+    """Returns each report's duration in minutes as a float array (NaN where unknown)."""
+    start = df["وقت البداية"].astype("Float64").to_numpy(dtype=np.float64, na_value=np.nan)
+    end = df["وقت النهاية"].astype("Float64").to_numpy(dtype=np.float64, na_value=np.nan)
+    durations = (end - start) / 60
+    # A report that ends before it starts has no usable duration
+    return np.where(durations >= 0, durations, np.nan)
+
+
+def evaluation_durations(df):
+    """Number of evaluations and their mean, median and 90th percentile duration in minutes, per evaluator."""
+    durations = pd.Series(durations_minutes(df), index=df.index)
+    grouped = durations.groupby(df["اسم المستخدم"].fillna(""))
+    return pd.DataFrame({
+        "عدد التقييمات": grouped.size(),
+        "متوسط المدة (دقيقة)": grouped.mean(),
+        "الوسيط (دقيقة)": grouped.median(),
+        "90% (دقيقة)": grouped.quantile(0.9)
+    }).round(1).sort_values("عدد التقييمات", ascending=False)
+
+
+def evaluations_over_time(df, freq="D"):
+    """Number of evaluations started in each local hour ("h") or day ("D")."""
+    periods = to_local(df["وقت البداية"]).dt.floor(freq).dt.tz_localize(None)
+    return periods.value_counts().sort_index().rename("عدد التقييمات")
+
+
+def throughput(df, freq="D"):
+    """
+    Evaluations per evaluator per local hour ("h") or day ("D"): the number
+    of periods the evaluator was active, and the mean and highest number of
+    evaluations in an active period.
+    """
+    periods = to_local(df["وقت البداية"]).dt.floor(freq)
+    counts = periods.groupby([df["اسم المستخدم"].fillna(""), periods]).size()
+    grouped = counts.groupby(level=0)
+    return pd.DataFrame({
+        "فترات النشاط": grouped.size(),
+        "متوسط التقييمات في الفترة": grouped.mean(),
+        "أعلى عدد في فترة": grouped.max()
+    }).round(2).sort_values("متوسط التقييمات في الفترة", ascending=False)
+
+
+def vehicle_utilisation(df, hours_per_day=WORKING_HOURS_PER_DAY):
+    """
+    Per vehicle: evaluations, hours in evaluation, days used, hours used per
+    day of use, and the share of a `hours_per_day` working day those hours are.
+    """
+    hours = pd.Series(durations_minutes(df) / 60, index=df.index)
+    days = to_local(df["وقت البداية"]).dt.date
+    vehicles = df["رقم المركبة"].fillna("")
+    grouped = hours.groupby(vehicles)
+    usage = pd.DataFrame({
+        "عدد التقييمات": grouped.size(),
+        "ساعات التقييم": grouped.sum(),
+        "أيام الاستخدام": days.groupby(vehicles).nunique()
+    })
+    usage["ساعات لكل يوم"] = usage["ساعات التقييم"] / usage["أيام الاستخدام"].where(usage["أيام الاستخدام"] > 0)
+    usage["نسبة الاستخدام"] = usage["ساعات لكل يوم"] / hours_per_day
+    return usage.round(2).sort_values("ساعات التقييم", ascending=False)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Parquet archive of reports from closed months.
+
+Reports of months that are over are rarely looked at and never edited, so
+they are moved out of the live store into one directory per local month of
+their start time:
+
+    archive/month=2024-01/part-<uuid>.parquet
+
+A query for a date range only opens the months it overlaps (partition
+pruning) and reads only the columns it asks for (column projection).
+
+A month is rewritten when one of its reports is deleted. The new files are
+written into month=YYYY-MM.tmp and swapped in with renames; `recover` finishes
+or rolls back a swap interrupted by a crash.
+"""
+import os
+import shutil
+import uuid
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import ARCHIVE_DIR, REPORT_ID_COLUMN, REPORTS_COLUMNS, TIME_COLUMNS, tz
+from timestamps import to_local
+
+MONTH_PREFIX = "month="
+
+
+def months_of(epochs):
+    """Returns the local "YYYY-MM" month of every epoch time (empty where missing)."""
+    return to_local(epochs).dt.strftime("%Y-%m").fillna("")
+
+
+def month_start(month):
+    """Returns the epoch seconds at which a local "YYYY-MM" month starts."""
+    return int(tz.localize(datetime.strptime(month, "%Y-%m")).timestamp())
+
+
+def months_in_range(months, low=None, high=None):
+    """Returns the months (sorted "YYYY-MM" strings) that overlap the epoch range [low, high)."""
+    selected = []
+    for month in months:
+        start = month_start(month)
+        # Months are contiguous, so a month ends where the next calendar month starts
+        year, number = int(month[:4]), int(month[5:])
+        end = month_start(f"{year + number // 12}-{number % 12 + 1:02d}")
+        if (low is None or end > low) and (high is None or start < high):
+            selected.append(month)
+    return selected
+
+
+def _arrow_schema():
+    fields = [pa.field(col, pa.int64() if col in TIME_COLUMNS else pa.string()) for col in REPORTS_COLUMNS]
+    return pa.schema(fields)
+
+
+class ReportArchive:
+    """Month-partitioned Parquet files holding archived reports."""
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+
+    def _month_dir(self, month):
+        return os.path.join(self.directory, MONTH_PREFIX + month)
+
+    def recover(self):
+        """Completes or rolls back a month rewrite interrupted by a crash."""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".old"):
+                final = path[:-len(".old")]
+                if os.path.isdir(final):
+                    shutil.rmtree(path)
+                elif os.path.isdir(final + ".tmp"):
+                    os.replace(final + ".tmp", final)
+                    shutil.rmtree(path)
+                else:
+                    os.replace(path, final)
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                shutil.rmtree(os.path.join(self.directory, name))
+
+    def months(self):
+        """Returns the archived months as sorted "YYYY-MM" strings."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name[len(MONTH_PREFIX):] for name in os.listdir(self.directory)
+            if name.startswith(MONTH_PREFIX) and not name.endswith((".tmp", ".old"))
+        )
+
+    def _files(self, months):
+        files = []
+        for month in months:
+            month_dir = self._month_dir(month)
+            files.extend(os.path.join(month_dir, name) for name in sorted(os.listdir(month_dir)) if name.endswith(".parquet"))
+        return files
+
+    def count(self):
+        """Number of archived reports, read from the Parquet footers only."""
+        return sum(pq.read_metadata(path).num_rows for path in self._files(self.months()))
+
+    def read(self, months=None, columns=None, filters=None):
+        """
+        Returns the archived reports of `months` (all if None) as a DataFrame,
+        with only `columns` (all if None) and only the rows matching the
+        pyarrow `filters`. Times are Int64 epoch seconds.
+        """
+        columns = list(columns) if columns is not None else REPORTS_COLUMNS
+        files = self._files(self.months() if months is None else months)
+        if not files:
+            return pd.DataFrame(columns=columns).astype({col: "Int64" for col in columns if col in TIME_COLUMNS})
+        table = pq.read_table(files, columns=columns, filters=filters, schema=_arrow_schema())
+        return table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+
+    def write(self, df):
+        """
+        Adds reports (a DataFrame with REPORTS_COLUMNS and typed times) to
+        the archive, one new file per month. Reports whose ID is already
+        archived are skipped, so a move repeated after a crash adds nothing twice.
+        """
+        df = df[df["وقت البداية"].notna()]
+        for month, rows in df.groupby(months_of(df["وقت البداية"]).to_numpy()):
+            if month in self.months():
+                archived = set(self.read([month], columns=[REPORT_ID_COLUMN])[REPORT_ID_COLUMN])
+                rows = rows[~rows[REPORT_ID_COLUMN].isin(archived)]
+            if rows.empty:
+                continue
+            month_dir = self._month_dir(month)
+            os.makedirs(month_dir, exist_ok=True)
+            self._write_file(rows, os.path.join(month_dir, f"part-{uuid.uuid4().hex}.parquet"))
+
+    @staticmethod
+    def _write_file(rows, path):
+        table = pa.Table.from_pandas(rows.reindex(columns=REPORTS_COLUMNS), schema=_arrow_schema(), preserve_index=False)
+        pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def delete(self, report_ids):
+        """
+        Removes the reports with these IDs from the archive and returns the
+        removed reports. Only the months holding one of them are rewritten.
+        """
+        wanted = {str(i) for i in report_ids}
+        if not wanted:
+            return self.read([])
+        removed = []
+        for month in self.months():
+            ids = self.read([month], columns=[REPORT_ID_COLUMN])[REPORT_ID_COLUMN]
+            if not ids.isin(wanted).any():
+                continue
+            rows = self.read([month])
+            hit = rows[REPORT_ID_COLUMN].isin(wanted)
+            removed.append(rows[hit])
+            self._replace_month(month, rows[~hit])
+        if not removed:
+            return self.read([])
+        return pd.concat(removed, ignore_index=True)
+
+    def _replace_month(self, month, rows):
+        final = self._month_dir(month)
+        tmp, old = final + ".tmp", final + ".old"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        if not rows.empty:
+            self._write_file(rows, os.path.join(tmp, f"part-{uuid.uuid4().hex}.parquet"))
+        os.replace(final, old)
+        os.replace(tmp, final)
+        shutil.rmtree(old)
+        if rows.empty:
+            os.rmdir(final)
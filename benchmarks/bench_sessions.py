@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end rerun benchmark.
+
+Generates a large users file and reports history in a temporary directory,
+then drives the app headlessly with Streamlit's AppTest through many
+evaluator sessions at once, each in its own thread: login, start an
+evaluation, record errors, save the report and open the reports page. The
+sessions share the app's process-wide resources, so their saves meet in the
+writer thread's group commits and contend for the same locks. Prints the p50
+and p99 time of every step under that load and the overall throughput, so
+changes to the app can be compared before and after.
+
+    python benchmarks/bench_sessions.py --sessions 50 --reports 200000
+    python benchmarks/bench_sessions.py --sessions 100 --concurrency 20
+    python benchmarks/bench_sessions.py --backend sqlite --max-p99 2.0
+
+With --max-p99 the script exits with status 1 when any step's p99 (in
+seconds) is above the limit, so it can be used as a regression check.
+
+Running sessions in parallel patches private AppTest internals, so it is
+only done on the Streamlit release they were checked against
+(SHARED_RUNTIME_STREAMLIT). On any other release the sessions run one at a
+time and the script says so.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_FILE = os.path.join(APP_DIR, "streamlit_app.py")
+
+STEPS = ["login", "start", "error", "save", "reports"]
+
+# Streamlit release whose AppTest internals share_apptest_runtime was written against
+SHARED_RUNTIME_STREAMLIT = "1.65.0"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time app reruns over simulated evaluator sessions.")
+    parser.add_argument("--sessions", type=int, default=20, help="evaluator sessions to run (default: 20)")
+    parser.add_argument("--concurrency", type=int, help="sessions running at the same time (default: all of them)")
+    parser.add_argument("--users", type=int, default=1000, help="users in the generated users file (default: 1000)")
+    parser.add_argument("--reports", type=int, default=100000, help="reports in the generated history (default: 100000)")
+    parser.add_argument("--errors", type=int, default=3, help="errors recorded per evaluation (default: 3)")
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="csv", help="storage backend (default: csv)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the generated data")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    parser.add_argument("--max-p99", type=float, help="fail if any step's p99 is above this many seconds")
+    return parser.parse_args()
+
+
+# ------------------------------
+# Dataset generation
+# ------------------------------
+def generate_dataset(users, reports, rng):
+    """Writes users.csv and reports.csv into the current directory."""
+    from config import (
+        ERRORS_LIST, ERRORS_MASK_COLUMN, INITIAL_USERS, REPORT_ID_COLUMN, REPORTS_COLUMNS, REPORTS_FILE, ROLES,
+        USERS_COLUMNS, USERS_FILE
+    )
+    from error_codes import encode_errors
+
+    evaluators = pd.DataFrame({
+        "username": [f"user{i}" for i in range(users)],
+        "password": "pass",
+        "role": ROLES["evaluator"],
+        "evaluator_access": "True",
+        "name": [f"مقيم {i}" for i in range(users)],
+        "vehicle_number": [str(1000 + i % 500) for i in range(users)]
+    })
+    pd.concat([pd.DataFrame(INITIAL_USERS), evaluators])[USERS_COLUMNS].to_csv(USERS_FILE, index=False, encoding="utf-8")
+
+    # Epoch seconds, as the app stores them
+    start = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()) + rng.integers(0, 365 * 24 * 3600, reports)
+    errors = [rng.choice(len(ERRORS_LIST), size=rng.integers(0, 6), replace=False) for _ in range(reports)]
+    names = [[ERRORS_LIST[j] for j in row] for row in errors]
+    owners = rng.integers(0, users, reports)
+    df = pd.DataFrame({
+        REPORT_ID_COLUMN: np.arange(1, reports + 1),
+        "اسم التقرير": [f"تقرير {i}" for i in range(reports)],
+        "وقت البداية": start,
+        "وقت النهاية": start + rng.integers(15 * 60, 45 * 60, reports),
+        "الأخطاء": ["; ".join(row) for row in names],
+        "ملاحظات": "",
+        "اسم المستخدم": [f"user{i}" for i in owners],
+        "رقم المركبة": [str(1000 + i % 500) for i in owners],
+        ERRORS_MASK_COLUMN: [encode_errors(row) for row in names]
+    })
+    df.reindex(columns=REPORTS_COLUMNS).to_csv(REPORTS_FILE, index=False, encoding="utf-8")
+
+
+# ------------------------------
+# Sessions
+# ------------------------------
+def _button(at, label=None, key=None):
+    for button in at.button:
+        if (key is not None and button.key == key) or (label is not None and button.label == label):
+            return button
+    raise RuntimeError(f"Button not found: {label or key}")
+
+
+def _timed(timings, step, action):
+    start = time.perf_counter()
+    at = action()
+    timings[step].append(time.perf_counter() - start)
+    if at.exception:
+        raise RuntimeError(f"{step} failed: {at.exception[0].value}")
+    return at
+
+
+def share_apptest_runtime():
+    """
+    Lets AppTest sessions run in parallel threads. AppTest is written for one
+    test at a time: every run installs a mock Runtime and patches the config
+    for its own duration, and the first run to finish would remove both from
+    under the others. Here one mock Runtime and one config patch are installed
+    for the whole benchmark, and the per-run ones are turned into no-ops.
+    Every run also compiles the script into its own ScriptCache, and parallel
+    compiles break CPython's parser, so all runs share one (it has a lock).
+
+    These are private internals, so returns False without patching anything
+    unless Streamlit is SHARED_RUNTIME_STREAMLIT and they are all there.
+    """
+    import contextlib
+    from unittest.mock import MagicMock
+
+    import streamlit
+    if streamlit.__version__ != SHARED_RUNTIME_STREAMLIT:
+        return False
+    try:
+        from streamlit.components.v2.component_manager import BidiComponentManager
+        from streamlit.runtime import Runtime
+        from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+        from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+        from streamlit.runtime.media_file_manager import MediaFileManager
+        from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+        from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+        from streamlit.testing.v1 import app_test, local_script_runner
+        from streamlit.testing.v1.util import patch_config_options
+    except ImportError:
+        return False
+    if not all(hasattr(module, name) for module, name in [
+        (app_test, "Runtime"), (app_test, "ScriptCache"), (app_test, "patch_config_options"),
+        (local_script_runner, "ScriptCache"), (Runtime, "_instance")
+    ]):
+        return False
+
+    class _PerRunRuntime(Runtime):
+        """Receives AppTest's per-run `_instance` assignments instead of Runtime."""
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.bidi_component_registry = BidiComponentManager()
+    runtime.bidi_component_registry.discover_and_register_components(start_file_watching=False)
+    Runtime._instance = runtime
+    app_test.Runtime = _PerRunRuntime
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    patch_config_options({"global.appTest": True}).__enter__()
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+    return True
+
+
+def run_session(timings, username, errors, rng, barrier=None):
+    """
+    Runs one evaluator session and appends the time of every step to `timings`.
+    With a barrier, the timed steps start only once every session of the wave
+    has loaded the login page.
+    """
+    from config import ERRORS_LIST
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_FILE, default_timeout=120)
+    at.run()
+    if barrier is not None:
+        barrier.wait()
+    at.text_input[0].input(username)
+    at.text_input[1].input("pass")
+    at = _timed(timings, "login", lambda: _button(at, "دخول").click().run())
+
+    at.text_input[0].input(f"تقييم {username}")
+    at = _timed(timings, "start", lambda: _button(at, "ابدأ التقييم").click().run())
+
+    for i in rng.choice(len(ERRORS_LIST), size=errors, replace=False):
+        at = _timed(timings, "error", lambda: _button(at, key=f"err_btn_{i}").click().run())
+
+    at = _timed(timings, "save", lambda: _button(at, "إنهاء التقييم").click().run())
+    _timed(timings, "reports", lambda: _button(at, "📑 عرض السجلات").click().run())
+
+
+def run_sessions(timings, args):
+    """
+    Runs `args.sessions` sessions, `args.concurrency` at a time, each in its
+    own thread. Returns the wall time in seconds and the concurrency used.
+    """
+    concurrency = min(args.concurrency or args.sessions, args.sessions)
+    if concurrency > 1 and not share_apptest_runtime():
+        print(f"Streamlit {SHARED_RUNTIME_STREAMLIT} is needed to run sessions in parallel; running them one at a time",
+              file=sys.stderr)
+        concurrency = 1
+    started = time.perf_counter()
+    for first in range(0, args.sessions, concurrency):
+        wave = range(first, min(first + concurrency, args.sessions))
+        # A session that fails before the barrier breaks it after the timeout instead of hanging the others
+        barrier = threading.Barrier(len(wave), timeout=300)
+        with ThreadPoolExecutor(max_workers=len(wave)) as pool:
+            # numpy generators are not thread-safe, so every session gets its own
+            futures = [
+                pool.submit(run_session, timings, f"user{i % args.users}", args.errors,
+                            np.random.default_rng([args.seed, i]), barrier)
+                for i in wave
+            ]
+            for future in futures:
+                future.result()
+    return time.perf_counter() - started, concurrency
+
+
+def summarize(timings):
+    rows = {}
+    for step in STEPS:
+        values = np.array(timings[step])
+        if len(values):
+            rows[step] = {"count": len(values), "p50": float(np.percentile(values, 50)), "p99": float(np.percentile(values, 99)), "max": float(values.max())}
+    return rows
+
+
+def main():
+    args = parse_args()
+    os.environ["EVALUATION_STORAGE"] = args.backend
+    sys.path.insert(0, APP_DIR)
+    rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory(prefix="evaluation-bench-") as workdir:
+        os.chdir(workdir)
+        started = time.perf_counter()
+        generate_dataset(args.users, args.reports, rng)
+        if args.backend == "sqlite":
+            # The first start migrates the CSV files; that is not part of a session
+            from storage import create_storage
+            create_storage(args.backend).ensure_ready()
+        print(f"Generated {args.users} users and {args.reports} reports in {time.perf_counter() - started:.1f}s ({args.backend})")
+
+        timings = {step: [] for step in STEPS}
+        wall, concurrency = run_sessions(timings, args)
+        os.chdir(APP_DIR)
+
+    results = summarize(timings)
+    throughput = {
+        "wall_s": wall,
+        "sessions_per_s": args.sessions / wall,
+        "reruns_per_s": sum(len(values) for values in timings.values()) / wall,
+        "saves_per_s": len(timings["save"]) / wall
+    }
+    print(f"{'step':<10}{'count':>8}{'p50 (s)':>12}{'p99 (s)':>12}{'max (s)':>12}")
+    for step, row in results.items():
+        print(f"{step:<10}{row['count']:>8}{row['p50']:>12.3f}{row['p99']:>12.3f}{row['max']:>12.3f}")
+    print(f"{args.sessions} sessions, {concurrency} at a time, in {wall:.1f}s: "
+          f"{throughput['sessions_per_s']:.2f} sessions/s, {throughput['reruns_per_s']:.1f} reruns/s, "
+          f"{throughput['saves_per_s']:.2f} saves/s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"backend": args.backend, "sessions": args.sessions, "concurrency": concurrency, "users": args.users,
+                       "reports": args.reports, "steps": results, "throughput": throughput}, f, indent=2)
+
+    if args.max_p99 is not None:
+        slow = [step for step, row in results.items() if row["p99"] > args.max_p99]
+        if slow:
+            sys.exit(f"p99 above {args.max_p99}s for: {', '.join(slow)}")
+
+
+if __name__ == "__main__":
+    main()
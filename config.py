@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Settings shared by the app and its storage layer
+import os
+import pytz
+
+# ------------------------------
+# General Settings
+# ------------------------------
+REPORTS_FILE = "reports.csv"
+# New reports are appended here; REPORTS_FILE holds the older, compacted reports
+REPORTS_JOURNAL = "reports.jsonl"
+# Flush every saved report to disk before confirming it to the user
+JOURNAL_FSYNC = True
+USERS_FILE = "users.csv"
+# Report counts per evaluator, vehicle and day, kept up to date by the CSV backend (see summaries.py)
+SUMMARY_FILE = "summary.csv"
+# Changes to the summary since SUMMARY_FILE was last rewritten, folded into it by compaction
+SUMMARY_JOURNAL = "summary.jsonl"
+# Month-partitioned Parquet files holding the reports of closed months (see archive.py)
+ARCHIVE_DIR = "archive"
+# Closed months kept in the live store before they are archived, besides the current month
+ARCHIVE_KEEP_MONTHS = 1
+# Seconds between the writer's checks for reports old enough to archive
+ARCHIVE_CHECK_INTERVAL = 3600
+# Evaluations in progress, one small journal per evaluator (see drafts.py)
+DRAFTS_DIR = "drafts"
+# SQLite database used when the "sqlite" storage backend is selected
+DATABASE_FILE = "evaluation.db"
+# Held by the one process allowed to write the store: the app, the importer or a storage.py command (see store_lock.py)
+STORE_LOCK_FILE = "store.lock"
+# Storage backend: "csv" (default, compatible with existing files) or "sqlite"
+STORAGE_BACKEND = os.environ.get("EVALUATION_STORAGE", "csv")
+tz = pytz.timezone("Asia/Riyadh")
+
+# Define user roles for easy access
+ROLES = {
+    "admin": "admin",
+    "evaluator": "evaluator",
+    "viewer": "viewer"
+}
+
+# List of errors for the evaluation page, updated with new buttons
+ERRORS_LIST = [
+    "باب السائق", "حزام", "افضلية", "سرعة", "ضعف مراقبة",
+    "عدم التقيد بالمسارات", "سرعة اثناء الانعطاف", "إشارة للموازي",
+    "موقف موازي", "صدم بالموازي", "مراقبة اثناء الخروج", "استخدام كلتا القدمين",
+    "ضعف تحكم بالمقود", "صدم ثمانية", "إشارة ٩٠خلفي", "موقف ٩٠خلفي",
+    "صدم ٩٠خلفي", "عكس سير", "فلشر للرجوع", "الرجوع للخلف",
+    "مراقبة اثناء الرجوع", "تسارع عالي", "تباطؤ", "فرامل", "علامةقف",
+    "صدم رصيف", "خطوط المشاة", "تجاوز اشارة", "موقف نهائي", "صدم نهائي",
+    "التموضع بالموازي", "تموضع ٩٠خلفي"
+]
+
+# Unique, increasing ID given to every report when it is saved
+REPORT_ID_COLUMN = "رقم التقرير"
+
+# Column holding the recorded errors as a bit mask (see error_codes.py)
+ERRORS_MASK_COLUMN = "رمز الأخطاء"
+
+# Column holding when each error was recorded, as "code@seconds" pairs (see error_codes.py)
+ERROR_EVENTS_COLUMN = "توقيت الأخطاء"
+
+# ID an imported report had at the site it came from, empty for reports saved here (see importer.py)
+SOURCE_ID_COLUMN = "رقم التقرير الأصلي"
+
+# Columns of the reports table, in display order
+REPORTS_COLUMNS = [REPORT_ID_COLUMN, "اسم التقرير", "وقت البداية", "وقت النهاية", "الأخطاء", "ملاحظات", "اسم المستخدم", "رقم المركبة", ERRORS_MASK_COLUMN, ERROR_EVENTS_COLUMN, SOURCE_ID_COLUMN]
+
+# Report times, stored as epoch seconds (UTC) and shown in `tz` (see timestamps.py)
+TIME_COLUMNS = ["وقت البداية", "وقت النهاية"]
+
+# Columns of the users table, including name and vehicle number
+USERS_COLUMNS = ["username", "password", "role", "evaluator_access", "name", "vehicle_number"]
+
+# Most queued writes applied together in one group commit
+COMMIT_BATCH_SIZE = 500
+# Seconds a session waits for its write to be committed before reporting an error
+COMMIT_TIMEOUT = 30
+
+# The reports store is compacted once this share of its rows are deleted reports...
+COMPACTION_TOMBSTONE_RATIO = 0.2
+# ...or once the reports journal holds this many records
+COMPACTION_JOURNAL_RECORDS = 50000
+
+# Reports shown per page on the reports page
+REPORTS_PAGE_SIZE = 50
+# Memory used at most by the cache of prepared report pages (see report_cache.py)
+REPORTS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Users shown per page in the admin user editor
+USERS_PAGE_SIZE = 25
+# Length of a vehicle's working day, used for its utilisation on the durations page
+WORKING_HOURS_PER_DAY = 8
+
+# Rows parsed at a time when the CSV backend scans the reports for a query
+REPORTS_CHUNK_SIZE = 50000
+# Rows validated and written per bulk write by the importer (see importer.py)
+IMPORT_CHUNK_SIZE = 10000
+
+# Fonts with Arabic glyphs tried in order for the PDF export; EVALUATION_PDF_FONT overrides them
+PDF_FONT_FILES = [
+    os.environ.get("EVALUATION_PDF_FONT"),
+    "fonts/Amiri-Regular.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "C:/Windows/Fonts/arial.ttf"
+]
+# Worker processes used to render large PDF exports
+PDF_EXPORT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Smaller exports are rendered in the app process, where starting workers would cost more than it saves
+PDF_PARALLEL_THRESHOLD = 20
+# Most reports exported into one ZIP file
+PDF_EXPORT_MAX_REPORTS = 10000
+# Largest ZIP file returned by the export, which the app holds in memory for its download button
+PDF_EXPORT_MAX_BYTES = 50 * 1024 * 1024
+
+# Time reruns and storage calls for the admin performance panel; set EVALUATION_PROFILING=0 to turn off
+PROFILING_ENABLED = os.environ.get("EVALUATION_PROFILING", "1") != "0"
+# JSON-lines file every timing sample is appended to; empty (the default) keeps them in memory only
+PROFILE_LOG_FILE = os.environ.get("EVALUATION_PROFILE_LOG", "")
+# Samples kept in memory for the admin performance panel
+PROFILE_MAX_SAMPLES = 20000
+
+# Users created the first time the app runs
+INITIAL_USERS = [
+    {"username": "hus585", "password": "268450", "role": ROLES["admin"], "evaluator_access": "True", "name": "المستخدم الرئيسي", "vehicle_number": "12345"},
+    {"username": "qwe", "password": "123123", "role": ROLES["viewer"], "evaluator_access": "False", "name": "المشاهد", "vehicle_number": "98765"}
+]
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk drafts of evaluations in progress.
+
+Every evaluator has at most one draft: a small journal in DRAFTS_DIR that
+starts with a header record and then gets one compact event per tap:
+
+    {"r": draft_id, "e": 3, "t": 125}     error code 3 recorded 125 s after the start
+    {"r": draft_id, "u": 1, "t": 140}     the last recorded error was undone
+    {"r": draft_id, "n": "..."}           the notes were changed
+
+Each event is a single append, so a dropped connection or a restarted server
+loses nothing. Events are not fsynced: tap latency matters more than a power
+cut in the middle of an evaluation. After logging in again the draft is
+replayed and the evaluation continues where it stopped. Finishing the
+evaluation turns the draft into one report and removes the file.
+"""
+import json
+import os
+import time
+import uuid
+from urllib.parse import quote
+
+from config import DRAFTS_DIR
+from journal import append_record, read_records
+from user_index import normalize_username
+
+
+def draft_path(username):
+    """Returns the draft file of a user; the username is escaped to a safe file name."""
+    return os.path.join(DRAFTS_DIR, quote(normalize_username(username), safe="") + ".jsonl")
+
+
+def start_draft(username, report_name, start_time, vehicle_number):
+    """
+    Starts a new draft for the user, replacing any previous one, and returns
+    it as a dict (see `load_draft`).
+    """
+    os.makedirs(DRAFTS_DIR, exist_ok=True)
+    draft = {
+        "draft_id": uuid.uuid4().hex,
+        "report_name": report_name,
+        "start_time": start_time,
+        "started_at": time.time(),
+        "vehicle_number": vehicle_number
+    }
+    path = draft_path(username)
+    # Written to a new file and renamed, so an old draft is never mixed with the new one
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(json.dumps(draft, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+    return {**draft, "events": [], "notes": ""}
+
+
+def _elapsed(draft):
+    return max(0, int(time.time() - draft["started_at"]))
+
+
+def record_event(username, draft, code):
+    """Appends an error event to the draft and returns it as (code, offset in seconds)."""
+    event = (code, _elapsed(draft))
+    append_record(draft_path(username), {"r": draft["draft_id"], "e": code, "t": event[1]})
+    draft["events"].append(event)
+    return event
+
+
+def record_undo(username, draft):
+    """Appends the undoing of the last error event to the draft."""
+    append_record(draft_path(username), {"r": draft["draft_id"], "u": 1, "t": _elapsed(draft)})
+    if draft["events"]:
+        draft["events"].pop()
+
+
+def record_notes(username, draft, notes):
+    """Appends the current notes to the draft."""
+    append_record(draft_path(username), {"r": draft["draft_id"], "n": notes})
+    draft["notes"] = notes
+
+
+def load_draft(username):
+    """
+    Replays the user's draft and returns it as a dict with the header fields,
+    "events" (a list of (code, offset) in the order recorded) and "notes",
+    or None if the user has no draft.
+    """
+    draft = None
+    for record in read_records(draft_path(username)):
+        if "draft_id" in record:
+            draft = {**record, "events": [], "notes": ""}
+        elif draft is None or record.get("r") != draft["draft_id"]:
+            continue
+        elif "e" in record:
+            draft["events"].append((record["e"], record["t"]))
+        elif "u" in record:
+            if draft["events"]:
+                draft["events"].pop()
+        elif "n" in record:
+            draft["notes"] = record["n"]
+    return draft
+
+
+def discard_draft(username):
+    """Removes the user's draft, if any."""
+    try:
+        os.remove(draft_path(username))
+    except FileNotFoundError:
+        pass
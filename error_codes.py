@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Compact encoding of the errors recorded in a report.
+
+Every entry of ERRORS_LIST has a fixed bit position, so the set of errors of
+one report fits in a single 32-bit integer. Reports saved before the mask
+column existed only have the "; "-joined text, which is decoded on the fly.
+
+Reports saved from a draft (see drafts.py) also keep when each error was
+recorded, as "code@seconds" events relative to the start of the evaluation.
+"""
+import numpy as np
+import pandas as pd
+
+from config import ERRORS_LIST, ERRORS_MASK_COLUMN
+
+# Stable bit position of every error. Saved reports depend on these numbers:
+# never renumber or reuse a position, give new errors the next free one.
+ERROR_CODES = {
+    "باب السائق": 0,
+    "حزام": 1,
+    "افضلية": 2,
+    "سرعة": 3,
+    "ضعف مراقبة": 4,
+    "عدم التقيد بالمسارات": 5,
+    "سرعة اثناء الانعطاف": 6,
+    "إشارة للموازي": 7,
+    "موقف موازي": 8,
+    "صدم بالموازي": 9,
+    "مراقبة اثناء الخروج": 10,
+    "استخدام كلتا القدمين": 11,
+    "ضعف تحكم بالمقود": 12,
+    "صدم ثمانية": 13,
+    "إشارة ٩٠خلفي": 14,
+    "موقف ٩٠خلفي": 15,
+    "صدم ٩٠خلفي": 16,
+    "عكس سير": 17,
+    "فلشر للرجوع": 18,
+    "الرجوع للخلف": 19,
+    "مراقبة اثناء الرجوع": 20,
+    "تسارع عالي": 21,
+    "تباطؤ": 22,
+    "فرامل": 23,
+    "علامةقف": 24,
+    "صدم رصيف": 25,
+    "خطوط المشاة": 26,
+    "تجاوز اشارة": 27,
+    "موقف نهائي": 28,
+    "صدم نهائي": 29,
+    "التموضع بالموازي": 30,
+    "تموضع ٩٠خلفي": 31,
+}
+
+# Error names indexed by their bit position
+ERROR_NAMES = [name for name, code in sorted(ERROR_CODES.items(), key=lambda item: item[1])]
+
+# Number of bits in a mask
+MASK_BITS = 32
+
+assert set(ERROR_CODES) == set(ERRORS_LIST), "every entry of ERRORS_LIST needs an error code"
+assert max(ERROR_CODES.values()) < MASK_BITS, "error codes must fit in a 32-bit mask"
+
+
+def encode_errors(errors):
+    """Returns the bit mask of a list of error names. Unknown names are ignored."""
+    mask = 0
+    for err in errors:
+        code = ERROR_CODES.get(err)
+        if code is not None:
+            mask |= 1 << code
+    return mask
+
+
+def decode_errors(mask):
+    """Returns the error names set in `mask`, in code order."""
+    mask = int(mask)
+    return [name for code, name in enumerate(ERROR_NAMES) if mask >> code & 1]
+
+
+def encode_events(events):
+    """
+    Returns the compact text of a list of (error code, offset in seconds)
+    events, e.g. "3@125;5@410", in the order they were recorded.
+    """
+    return ";".join(f"{code}@{offset}" for code, offset in events)
+
+
+def decode_events(text):
+    """Returns the (error code, offset in seconds) events of an encoded string."""
+    if not isinstance(text, str) or not text:
+        return []
+    return [tuple(int(part) for part in event.split("@")) for event in text.split(";")]
+
+
+def masks_from_text(errors_text):
+    """
+    Vectorized encoding of a Series of "; "-joined error strings, as stored
+    by reports saved before the mask column existed.
+    """
+    names = errors_text.fillna("").str.split("; ").explode()
+    codes = names.map(ERROR_CODES).dropna().astype(np.int64)
+    # Drop repeated entries of the same report so that summing the bits equals OR-ing them
+    pairs = pd.DataFrame({"row": codes.index, "code": codes.to_numpy()}).drop_duplicates()
+    masks = (np.int64(1) << pairs["code"]).groupby(pairs["row"].to_numpy()).sum()
+    return masks.reindex(errors_text.index, fill_value=0).astype(np.uint32)
+
+
+def error_masks(df):
+    """
+    Returns the error mask of every report in a reports DataFrame as a uint32
+    array, falling back to the error text for rows without a stored mask.
+    """
+    if ERRORS_MASK_COLUMN in df:
+        stored = pd.to_numeric(df[ERRORS_MASK_COLUMN], errors="coerce")
+    else:
+        stored = pd.Series(np.nan, index=df.index)
+    missing = stored.isna()
+    masks = stored.fillna(0).astype(np.int64)
+    if missing.any():
+        masks[missing] = masks_from_text(df.loc[missing, "الأخطاء"]).astype(np.int64)
+    return masks.to_numpy().astype(np.uint32)
+
+
+def mask_bits(masks):
+    """Expands an array of masks into an (n, MASK_BITS) boolean matrix."""
+    return (masks[:, None] >> np.arange(MASK_BITS, dtype=np.uint32) & 1).astype(bool)
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk import of users and reports from CSV dumps, such as the ones sent by
+test sites that run offline:
+
+    python importer.py users examiners.csv
+    python importer.py reports evaluations.csv --chunk-size 20000
+
+The input is read IMPORT_CHUNK_SIZE rows at a time, so memory stays bounded
+however large the file is. Every chunk is validated and then written with one
+bulk call of the storage backend (one users write, or one journal append or
+SQLite transaction for reports). A progress line is printed per chunk, and
+rejected rows are written with the reason to <input>.rejected.csv.
+
+Users are deduplicated on their username, ignoring letter case, against the
+stored users and the rest of the input. Reports are deduplicated on their
+username and the ID they had at their site, which is kept as their source
+ID (SOURCE_ID_COLUMN), so a dump imported twice adds nothing the second
+time; every imported report gets a new ID of this store. The reports of
+every chunk are looked up in the store, so the stored ones are never all
+loaded at once.
+
+The importer writes the store directly instead of through the app's writer
+thread, so it takes the store lock (see store_lock.py) and refuses to start
+while the app or another import is running.
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+from config import (
+    ERROR_EVENTS_COLUMN, ERRORS_LIST, ERRORS_MASK_COLUMN, IMPORT_CHUNK_SIZE, REPORT_ID_COLUMN, REPORTS_COLUMNS,
+    ROLES, SOURCE_ID_COLUMN, STORAGE_BACKEND, USERS_COLUMNS
+)
+from error_codes import decode_events, masks_from_text
+from storage import create_storage
+from store_lock import StoreLock, StoreLockedError
+from timestamps import parse_times
+
+REASON_COLUMN = "reason"
+
+# Columns an input file must have; the others of USERS_COLUMNS / REPORTS_COLUMNS are optional
+REQUIRED_USER_COLUMNS = ["username", "password", "name", "vehicle_number"]
+REQUIRED_REPORT_COLUMNS = ["اسم التقرير", "وقت البداية", "وقت النهاية", "الأخطاء", "اسم المستخدم", "رقم المركبة"]
+
+
+class ImportSchemaError(ValueError):
+    """The input file does not have the columns of the table it is imported into."""
+
+
+def check_columns(columns, required, allowed):
+    """Raises ImportSchemaError if required columns are missing or unknown ones are present."""
+    missing = [col for col in required if col not in columns]
+    unknown = [col for col in columns if col not in allowed]
+    if missing:
+        raise ImportSchemaError(f"missing columns: {', '.join(missing)}")
+    if unknown:
+        raise ImportSchemaError(f"unknown columns: {', '.join(unknown)}")
+
+
+# ------------------------------
+# Validation
+# ------------------------------
+def _reject(reasons, mask, reason):
+    """Sets `reason` on the rows selected by `mask` that have no reason yet."""
+    reasons[mask & (reasons == "")] = reason
+
+
+def validate_users(chunk):
+    """
+    Returns (users, rejected): the valid rows of a users chunk as a DataFrame
+    with USERS_COLUMNS, and the other rows with a REASON_COLUMN.
+    """
+    chunk = chunk.reindex(columns=USERS_COLUMNS)
+    chunk["username"] = chunk["username"].fillna("").str.strip()
+    # New examiners need an admin to grant them access, as when they register themselves
+    chunk["role"] = chunk["role"].fillna("").replace("", ROLES["evaluator"])
+    chunk["evaluator_access"] = chunk["evaluator_access"].fillna("").replace("", str(False))
+    reasons = pd.Series("", index=chunk.index)
+    _reject(reasons, chunk["username"] == "", "empty username")
+    _reject(reasons, chunk["password"].fillna("") == "", "empty password")
+    _reject(reasons, ~chunk["role"].isin(list(ROLES.values())), "unknown role")
+    _reject(reasons, ~chunk["evaluator_access"].isin(["True", "False"]), "evaluator_access must be True or False")
+    return chunk[reasons == ""], chunk[reasons != ""].assign(**{REASON_COLUMN: reasons[reasons != ""]})
+
+
+def _valid_events(text):
+    try:
+        return all(0 <= code < len(ERRORS_LIST) and offset >= 0 for code, offset in decode_events(text))
+    except ValueError:
+        return False
+
+
+def validate_reports(chunk, stored_keys):
+    """
+    Returns (reports, rejected): the valid rows of a reports chunk as a
+    DataFrame with REPORTS_COLUMNS, and the other rows with a REASON_COLUMN.
+    The report ID of the input becomes the report's source ID.
+    `stored_keys(keys)` must return those of the given (username, source ID)
+    pairs that are already stored.
+    """
+    chunk = chunk.reindex(columns=REPORTS_COLUMNS)
+    reasons = pd.Series("", index=chunk.index)
+
+    # Every site numbers its reports from 1, so an ID only identifies a report together with its owner
+    ids = chunk[REPORT_ID_COLUMN].fillna("").str.strip()
+    well_formed = ids.str.fullmatch(r"[1-9][0-9]*")
+    _reject(reasons, (ids != "") & ~well_formed, "report ID must be a positive integer")
+    keys = pd.Series(list(zip(chunk["اسم المستخدم"].fillna(""), ids)), index=chunk.index)
+    stored = stored_keys(set(keys[well_formed]))
+    _reject(reasons, well_formed & keys.map(stored.__contains__), "report already imported")
+    _reject(reasons, well_formed & keys.duplicated(), "report repeated in the input")
+
+    # Every "; "-separated error must be an entry of ERRORS_LIST
+    names = chunk["الأخطاء"].fillna("").str.split("; ").explode()
+    names = names[names != ""]
+    unknown = names[~names.isin(ERRORS_LIST)]
+    _reject(reasons, chunk.index.isin(unknown.index), "unknown error name")
+
+    started, ended = parse_times(chunk["وقت البداية"]), parse_times(chunk["وقت النهاية"])
+    started.index = ended.index = chunk.index
+    _reject(reasons, started.isna(), "invalid start time")
+    _reject(reasons, ended.isna() & (chunk["وقت النهاية"].fillna("") != ""), "invalid end time")
+    _reject(reasons, (ended < started).fillna(False).astype(bool), "end time before start time")
+    _reject(reasons, chunk["اسم المستخدم"].fillna("").str.strip() == "", "empty username")
+    _reject(reasons, ~chunk[ERROR_EVENTS_COLUMN].map(_valid_events), "invalid error events")
+
+    valid = chunk[reasons == ""].copy()
+    # The store gives every imported report an ID of its own
+    valid[SOURCE_ID_COLUMN] = ids[reasons == ""].where(well_formed)
+    valid[REPORT_ID_COLUMN] = None
+    valid["ملاحظات"] = valid["ملاحظات"].fillna("")
+    valid[ERROR_EVENTS_COLUMN] = valid[ERROR_EVENTS_COLUMN].fillna("")
+    # The mask is always derived from the names, so it cannot disagree with them
+    valid[ERRORS_MASK_COLUMN] = masks_from_text(valid["الأخطاء"]).astype(str)
+    return valid, chunk[reasons != ""].assign(**{REASON_COLUMN: reasons[reasons != ""]})
+
+
+# ------------------------------
+# Import
+# ------------------------------
+def _write_rejected(rejected, path, header):
+    if not rejected.empty:
+        rejected.to_csv(path, mode="w" if header else "a", header=header, index=False, encoding="utf-8")
+        return False
+    return header
+
+
+def import_file(storage, kind, path, chunk_size=IMPORT_CHUNK_SIZE, rejected_path=None, progress=print):
+    """
+    Imports the users or reports (`kind`) of a CSV file into `storage`, one
+    bulk write per chunk. Returns (imported, rejected) row counts. Rejected
+    rows are written to `rejected_path` (by default <path>.rejected.csv).
+    Raises StoreLockedError if the app or another import is using the store.
+    """
+    if kind == "users":
+        required, allowed = REQUIRED_USER_COLUMNS, USERS_COLUMNS
+    else:
+        required, allowed = REQUIRED_REPORT_COLUMNS, [col for col in REPORTS_COLUMNS if col != SOURCE_ID_COLUMN]
+    rejected_path = rejected_path or os.path.splitext(path)[0] + ".rejected.csv"
+    if os.path.exists(rejected_path):
+        os.remove(rejected_path)
+
+    with StoreLock():
+        storage.ensure_ready()
+        imported = rejected = read = 0
+        header = True
+        started = time.perf_counter()
+        reader = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size, encoding="utf-8-sig")
+        for number, chunk in enumerate(reader, start=1):
+            if number == 1:
+                check_columns(list(chunk.columns), required, allowed)
+            read += len(chunk)
+            if kind == "users":
+                valid, bad = validate_users(chunk)
+                added = storage.add_users(valid.to_dict("records")) if not valid.empty else []
+                taken = valid[[not ok for ok in added]]
+                bad = pd.concat([bad, taken.assign(**{REASON_COLUMN: "username already taken"})])
+                imported += sum(added)
+            else:
+                # Earlier chunks are stored by now, so looking the chunk up in the store catches repeats of them too
+                valid, bad = validate_reports(chunk, storage.stored_source_keys)
+                if not valid.empty:
+                    storage.append_reports(valid.to_dict("records"))
+                imported += len(valid)
+            rejected += len(bad)
+            header = _write_rejected(bad, rejected_path, header)
+            progress(f"chunk {number}: {read} rows read, {imported} imported, {rejected} rejected ({time.perf_counter() - started:.1f}s)")
+    return imported, rejected
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Import users or reports from a CSV file in bulk.")
+    parser.add_argument("kind", choices=["users", "reports"], help="what the file holds")
+    parser.add_argument("path", help="CSV file to import (UTF-8, with a header row)")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help=f"rows per bulk write (default: {IMPORT_CHUNK_SIZE})")
+    parser.add_argument("--rejected", help="where to write the rejected rows (default: <path>.rejected.csv)")
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default=STORAGE_BACKEND, help="storage backend (default: EVALUATION_STORAGE)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rejected_path = args.rejected or os.path.splitext(args.path)[0] + ".rejected.csv"
+    try:
+        imported, rejected = import_file(create_storage(args.backend), args.kind, args.path, args.chunk_size, rejected_path)
+    except ImportSchemaError as e:
+        sys.exit(f"{args.path}: {e}")
+    except StoreLockedError:
+        sys.exit("The store is in use by the app or another import; stop it and run the import again.")
+    print(f"Imported {imported} {args.kind} into the {args.backend} store; {rejected} rejected.")
+    if rejected:
+        print(f"The rejected rows and their reasons are in {rejected_path}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only journal used to store reports.
+
+Every record is written as a single JSON object on its own line, so saving a
+report costs one append regardless of how many reports already exist. JSON
+keeps notes that contain line breaks on a single line, which means the last
+newline in the file is always the end of the last complete record.
+"""
+import json
+import os
+import threading
+
+# Serializes appends made from different Streamlit sessions of the same process
+_append_lock = threading.Lock()
+
+# Size of the blocks read backwards while looking for the last complete record
+_TAIL_BLOCK = 4096
+
+
+def _truncate_partial_tail(f):
+    """
+    Drops a partially written record left at the end of the journal by a crash.
+    `f` must be opened in binary read/write mode. Only the tail of the file is read.
+    """
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    if size == 0:
+        return
+    f.seek(size - 1)
+    if f.read(1) == b"\n":
+        return
+
+    # Walk backwards block by block until the previous newline is found
+    end = size
+    while end > 0:
+        start = max(0, end - _TAIL_BLOCK)
+        f.seek(start)
+        block = f.read(end - start)
+        pos = block.rfind(b"\n")
+        if pos != -1:
+            f.truncate(start + pos + 1)
+            return
+        end = start
+    f.truncate(0)
+
+
+def recover_journal(path):
+    """Removes any torn record at the end of the journal file, if it exists."""
+    if not os.path.exists(path):
+        return
+    with _append_lock, open(path, "r+b") as f:
+        _truncate_partial_tail(f)
+
+
+def append_records(path, records, fsync=False):
+    """
+    Appends records (dicts) to the journal in a single write.
+    When `fsync` is True the data is flushed to disk before returning.
+    """
+    if not records:
+        return
+    data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+    with _append_lock, open(path, "a+b") as f:
+        _truncate_partial_tail(f)
+        f.seek(0, os.SEEK_END)
+        f.write(data)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+
+
+def append_record(path, record, fsync=False):
+    """Appends a single record to the journal."""
+    append_records(path, [record], fsync=fsync)
+
+
+def replace_records(path, records, fsync=False):
+    """
+    Replaces the whole journal with `records`. The new journal is written
+    next to the old one and renamed over it, so a crash leaves one or the other.
+    """
+    data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+    with _append_lock:
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+
+def read_records(path):
+    """
+    Yields the records stored in the journal in the order they were written.
+    A torn last line (the process died mid-write) is skipped, not raised.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Only the last line can be torn; anything else is a corrupt entry
+                continue
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+PDF export of evaluation reports.
+
+Every report is rendered as one A4 evaluation sheet with reportlab. Arabic
+text is shaped with arabic_reshaper and reordered with python-bidi, since
+reportlab draws glyphs left to right without joining them.
+
+Large selections are rendered in a process pool. Each worker registers the
+font and prepares the page template once, and the finished PDFs are written
+into a ZIP file on disk one at a time as they come back, so the whole
+selection is never held in memory as separate documents. The finished ZIP
+is returned as bytes for the download button, so it is capped at
+PDF_EXPORT_MAX_BYTES: reports that would not fit are left out.
+"""
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import arabic_reshaper
+from bidi.algorithm import get_display
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from config import (
+    ERRORS_LIST, PDF_EXPORT_MAX_BYTES, PDF_EXPORT_WORKERS, PDF_FONT_FILES, PDF_PARALLEL_THRESHOLD, REPORT_ID_COLUMN
+)
+
+FONT_NAME = "EvaluationArabic"
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 40
+
+# Report fields printed at the top of the sheet, in order
+SHEET_FIELDS = [REPORT_ID_COLUMN, "اسم التقرير", "اسم المستخدم", "رقم المركبة", "وقت البداية", "وقت النهاية"]
+
+
+class PdfExportError(Exception):
+    """Raised when the PDF export cannot run, e.g. no font with Arabic glyphs is installed."""
+
+
+# ------------------------------
+# Per-process setup
+# ------------------------------
+def _register_font():
+    """Registers the first available font file. Runs once per process."""
+    if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return
+    for path in PDF_FONT_FILES:
+        if path and os.path.exists(path):
+            pdfmetrics.registerFont(TTFont(FONT_NAME, path))
+            return
+    raise PdfExportError(f"No Arabic font found; install one of: {', '.join(p for p in PDF_FONT_FILES if p)}")
+
+
+@lru_cache(maxsize=4096)
+def rtl(text):
+    """Shapes Arabic text and puts it in visual (left-to-right drawing) order."""
+    return get_display(arabic_reshaper.reshape(str(text)))
+
+
+@lru_cache(maxsize=1)
+def _page_template():
+    """
+    Returns the parts of the sheet that are the same for every report: the
+    shaped labels and the position of every error in the error grid.
+    """
+    _register_font()
+    column_width = (PAGE_WIDTH - 2 * MARGIN) / 2
+    error_cells = []
+    for i, err in enumerate(ERRORS_LIST):
+        # Two columns filled right to left, row by row
+        column, row = i % 2, i // 2
+        error_cells.append((err, rtl(err), PAGE_WIDTH - MARGIN - column * column_width, row))
+    return {
+        "title": rtl("ورقة تقييم"),
+        "labels": {field: rtl(field + ":") for field in SHEET_FIELDS},
+        "errors_title": rtl("الأخطاء"),
+        "notes_title": rtl("ملاحظات"),
+        "error_cells": error_cells,
+    }
+
+
+def _init_worker():
+    """Process pool initializer: pays the font and template cost once per worker."""
+    _page_template()
+
+
+# ------------------------------
+# Rendering
+# ------------------------------
+def _wrap(text, width, size):
+    """Splits text into lines that fit `width` points, keeping words whole."""
+    lines = []
+    for paragraph in str(text).splitlines() or [""]:
+        line = ""
+        for word in paragraph.split(" "):
+            candidate = f"{line} {word}".strip()
+            if line and pdfmetrics.stringWidth(rtl(candidate), FONT_NAME, size) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def render_report_pdf(report):
+    """Renders one report (a dict keyed by REPORTS_COLUMNS) and returns the PDF bytes."""
+    template = _page_template()
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    right = PAGE_WIDTH - MARGIN
+    y = PAGE_HEIGHT - MARGIN
+
+    pdf.setFont(FONT_NAME, 18)
+    pdf.drawCentredString(PAGE_WIDTH / 2, y, template["title"])
+    y -= 36
+
+    # Labels on the right, values to their left, as read in Arabic
+    pdf.setFont(FONT_NAME, 11)
+    for field in SHEET_FIELDS:
+        value = report.get(field)
+        value = "" if value is None or value != value else value
+        pdf.drawRightString(right, y, template["labels"][field])
+        pdf.drawRightString(right - 110, y, rtl(value))
+        y -= 20
+
+    y -= 10
+    pdf.setFont(FONT_NAME, 14)
+    pdf.drawRightString(right, y, template["errors_title"])
+    y -= 22
+    recorded = set(filter(None, str(report.get("الأخطاء") or "").split("; ")))
+    pdf.setFont(FONT_NAME, 10)
+    for err, shaped, x, row in template["error_cells"]:
+        row_y = y - row * 16
+        pdf.drawRightString(x, row_y, shaped)
+        pdf.drawRightString(x - pdfmetrics.stringWidth(shaped, FONT_NAME, 10) - 8, row_y, "✓" if err in recorded else "□")
+    y -= (len(ERRORS_LIST) + 1) // 2 * 16 + 14
+
+    pdf.setFont(FONT_NAME, 14)
+    pdf.drawRightString(right, y, template["notes_title"])
+    y -= 20
+    pdf.setFont(FONT_NAME, 10)
+    notes = report.get("ملاحظات")
+    for line in _wrap("" if notes is None or notes != notes else notes, PAGE_WIDTH - 2 * MARGIN, 10):
+        if y < MARGIN:
+            break
+        pdf.drawRightString(right, y, rtl(line))
+        y -= 14
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _render_job(report):
+    """Worker entry point: returns the file name and the PDF bytes of one report."""
+    return report_file_name(report), render_report_pdf(report)
+
+
+def report_file_name(report):
+    """Returns a safe file name for a report's PDF inside the ZIP file."""
+    name = re.sub(r'[\\/:*?"<>|\s]+', "_", str(report.get("اسم التقرير") or "report")).strip("_")
+    return f"{report.get(REPORT_ID_COLUMN)}_{name or 'report'}.pdf"
+
+
+# ------------------------------
+# Batch export
+# ------------------------------
+def iter_rendered(reports, workers=PDF_EXPORT_WORKERS):
+    """
+    Yields (file name, PDF bytes) for every report, in order. Large selections
+    are spread across a process pool with a bounded number of reports in flight.
+    """
+    if len(reports) < PDF_PARALLEL_THRESHOLD or workers <= 1:
+        for report in reports:
+            yield _render_job(report)
+        return
+
+    # "spawn" avoids forking the Streamlit server with its threads and sockets
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+        pending = deque()
+        for report in reports:
+            pending.append(pool.submit(_render_job, report))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def export_reports_zip(reports, workers=PDF_EXPORT_WORKERS, max_bytes=PDF_EXPORT_MAX_BYTES):
+    """
+    Renders the reports (a list of dicts) into a ZIP file of PDFs built in a
+    temporary file on disk. Returns the contents of the ZIP file as bytes and
+    the number of reports in it, which is smaller than len(reports) when the
+    next PDF would have taken the ZIP file over `max_bytes`.
+    """
+    _register_font()
+    fd, path = tempfile.mkstemp(suffix=".zip")
+    exported = 0
+    try:
+        with os.fdopen(fd, "wb") as output, zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            rendered = iter_rendered(reports, workers)
+            for file_name, pdf_bytes in rendered:
+                # The uncompressed size bounds what the entry adds; the rest is its directory record
+                if output.tell() + len(pdf_bytes) + 2 * len(file_name.encode()) + 200 > max_bytes:
+                    rendered.close()
+                    break
+                archive.writestr(file_name, pdf_bytes)
+                exported += 1
+        # Only the finished, compressed ZIP is held in memory, for the download button
+        with open(path, "rb") as zip_file:
+            return zip_file.read(), exported
+    finally:
+        os.remove(path)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Timing of Streamlit reruns and storage calls.
+
+`Profiler.rerun` wraps one execution of the script and attributes everything
+measured inside it to the page being shown. `ProfiledStorage` wraps the
+storage backend so that every read and write is timed with the number of
+rows it returned. Samples are kept in memory for the admin panel and, when
+a log file is configured, appended to it as JSON lines after every rerun.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+from config import PROFILE_LOG_FILE, PROFILE_MAX_SAMPLES, PROFILING_ENABLED
+from journal import append_records
+
+# Storage methods that change data; every other method is timed as a read
+WRITE_METHODS = {
+    "add_user", "add_users", "update_users", "append_report", "append_reports",
+    "delete_report", "delete_reports", "compact", "archive_reports", "rebuild_summary"
+}
+
+
+def _count_rows(result):
+    """Returns the number of rows in a storage call's result, if it has any."""
+    if isinstance(result, tuple) and result and isinstance(result[0], pd.DataFrame):
+        result = result[0]
+    if isinstance(result, (pd.DataFrame, list)):
+        return len(result)
+    return None
+
+
+class Profiler:
+    """Collects timing samples from every session of the process."""
+
+    def __init__(self, enabled=PROFILING_ENABLED, log_file=PROFILE_LOG_FILE, max_samples=PROFILE_MAX_SAMPLES):
+        self.enabled = enabled
+        self.log_file = log_file
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        # Each Streamlit session runs in its own thread, so the current rerun is per thread
+        self._local = threading.local()
+
+    @contextmanager
+    def rerun(self, page, name="main"):
+        """Times one run of the script (or of the fragment `name`) showing `page`."""
+        if not self.enabled:
+            yield
+            return
+        self._local.page = page
+        self._local.pending = []
+        self._local.rows = 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # st.rerun() ends a run with an exception, which is still a complete run
+            self._record("rerun", name, time.perf_counter() - start, self._local.rows)
+            pending, self._local.pending, self._local.page = self._local.pending, None, None
+            self._store(pending)
+
+    @contextmanager
+    def fragment(self, page, name):
+        """
+        Times a Streamlit fragment. Inside a full run it is one step of that
+        run; when it reruns on its own it is a rerun of its own.
+        """
+        if getattr(self._local, "pending", None) is not None:
+            with self.measure(name, "fragment"):
+                yield
+        else:
+            with self.rerun(page, name):
+                yield
+
+    @contextmanager
+    def measure(self, name, kind="function"):
+        """
+        Times the body of the `with` block. The yielded dict can be given a
+        "rows" entry to record how many rows the block handled.
+        """
+        sample = {"rows": None}
+        if not self.enabled:
+            yield sample
+            return
+        start = time.perf_counter()
+        try:
+            yield sample
+        finally:
+            self._record(kind, name, time.perf_counter() - start, sample["rows"])
+
+    def add_rows(self, rows):
+        """Counts rows sent to the browser during the current rerun."""
+        if self.enabled and getattr(self._local, "pending", None) is not None:
+            self._local.rows += rows
+
+    def _record(self, kind, name, seconds, rows=None):
+        sample = {
+            "time": round(time.time(), 3),
+            # Writes done by the writer thread happen outside any rerun
+            "page": getattr(self._local, "page", None) or "background",
+            "kind": kind,
+            "name": name,
+            "ms": round(seconds * 1000, 3),
+            "rows": rows
+        }
+        pending = getattr(self._local, "pending", None)
+        if pending is not None:
+            pending.append(sample)
+        else:
+            self._store([sample])
+
+    def _store(self, samples):
+        with self._lock:
+            self._samples.extend(samples)
+        if self.log_file:
+            append_records(self.log_file, samples)
+
+    def samples(self):
+        """Returns the collected samples, oldest first, as a DataFrame."""
+        with self._lock:
+            return pd.DataFrame(list(self._samples), columns=["time", "page", "kind", "name", "ms", "rows"])
+
+    def summary(self):
+        """Returns count, p50, p99, max and mean time, and total rows per page, kind and name."""
+        df = self.samples()
+        if df.empty:
+            return pd.DataFrame(columns=["count", "p50_ms", "p99_ms", "max_ms", "mean_ms", "rows"])
+        grouped = df.groupby(["page", "kind", "name"])
+        return pd.DataFrame({
+            "count": grouped["ms"].count(),
+            "p50_ms": grouped["ms"].median(),
+            "p99_ms": grouped["ms"].quantile(0.99),
+            "max_ms": grouped["ms"].max(),
+            "mean_ms": grouped["ms"].mean(),
+            "rows": grouped["rows"].sum()
+        }).round(2).sort_values("p99_ms", ascending=False)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+class ProfiledStorage:
+    """Wraps a storage backend and times every method called on it."""
+
+    def __init__(self, storage, profiler):
+        self._storage = storage
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        attr = getattr(self._storage, name)
+        if not callable(attr):
+            return attr
+        kind = "storage.write" if name in WRITE_METHODS else "storage.read"
+
+        def timed(*args, **kwargs):
+            with self._profiler.measure(name, kind) as sample:
+                result = attr(*args, **kwargs)
+                sample["rows"] = _count_rows(result)
+                return result
+        return timed
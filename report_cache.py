@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of prepared report pages for the reports page.
+
+Showing a page of reports means querying the store, formatting the times in
+local time and converting the DataFrame into an Arrow table for the browser.
+The result only changes when the reports do, so it is kept keyed on the
+store's `reports_version()`, the viewer's scope (everything for admins and
+viewers, one username for evaluators) and the query. Repeated views and
+going back and forth between pages then skip the query and the conversion.
+
+Entries are evicted least recently used first once their total size passes
+`max_bytes`. Entries of an older store version can never be used again, so
+they are dropped as soon as a newer version is stored, and a page loaded for
+an older version than the newest one stored is returned but not kept.
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import astuple
+
+import pyarrow as pa
+
+from config import REPORTS_CACHE_MAX_BYTES
+
+
+class CachedPage:
+    """One prepared page: the DataFrame shown, its Arrow table and the total number of matches."""
+
+    __slots__ = ("frame", "table", "total", "nbytes")
+
+    def __init__(self, frame, total):
+        self.frame = frame
+        self.table = pa.Table.from_pandas(frame, preserve_index=False)
+        self.total = total
+        self.nbytes = int(frame.memory_usage(deep=True).sum()) + self.table.nbytes
+
+
+class ReportPageCache:
+    """Process-wide LRU cache of prepared report pages, safe to share between sessions."""
+
+    def __init__(self, max_bytes=REPORTS_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, scope, query, load):
+        """
+        Returns the CachedPage of `query` for this store version and scope.
+        On a miss, `load()` must return (frame, total) for the query; it is
+        called without holding the lock, so slow queries do not block hits.
+        """
+        key = (version, scope, astuple(query))
+        with self._lock:
+            page = self._entries.get(key)
+            if page is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return page
+            self.misses += 1
+        page = CachedPage(*load())
+        self._put(key, page)
+        return page
+
+    def _put(self, key, page):
+        with self._lock:
+            version = key[0]
+            if self._version is None or version > self._version:
+                self._entries.clear()
+                self._nbytes = 0
+                self._version = version
+            elif version < self._version:
+                # A slow load that started before the last write; later requests use the newer version
+                return
+            # A page larger than the whole cache is returned but not kept
+            if page.nbytes > self.max_bytes or key in self._entries:
+                return
+            self._entries[key] = page
+            self._nbytes += page.nbytes
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+
+    def stats(self):
+        """Returns the number of entries, their size in bytes, and the hit and miss counts."""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._nbytes, "hits": self.hits, "misses": self.misses}
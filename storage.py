@@ -0,0 +1,1202 @@
+# -*- coding: utf-8 -*-
+"""
+Storage layer for users and reports.
+
+The app talks to a `StorageBackend` instead of reading and writing the CSV
+files directly. Two engines are provided:
+
+- `CsvBackend`: the original users.csv / reports.csv files (plus the reports
+  journal), kept for compatibility with existing deployments.
+- `SqliteBackend`: a single SQLite database with indexes on the lowercased
+  username, report owner, vehicle number and start time, so logins and
+  per-user report lookups do not scan the whole data set.
+
+Users are passed around as dicts keyed by USERS_COLUMNS and reports as dicts
+keyed by REPORTS_COLUMNS, with every value stored as a string. Report times
+(TIME_COLUMNS) are epoch seconds; the DataFrames returned by the backends
+hold them as Int64, and reports saved with local-time strings are rewritten
+as epoch seconds the first time the backend starts (see timestamps.py).
+
+Both backends also keep the summary table of summaries.py up to date in
+every write of reports, and move reports of closed months into the Parquet
+archive of archive.py. `load_reports` and `query_reports` return live and
+archived reports together; the backends only implement the live part.
+
+Run `python storage.py migrate` to copy the existing CSV files into the
+SQLite database once before switching EVALUATION_STORAGE to "sqlite",
+`python storage.py compact` to compact the reports store by hand,
+`python storage.py archive` to move closed months into the archive, and
+`python storage.py rebuild-summary` to recompute the summary table from the
+reports and check that it was consistent. The commands take the store lock
+of store_lock.py, so they refuse to run while the app is running.
+"""
+import os
+import sqlite3
+import sys
+import threading
+from dataclasses import dataclass, replace
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from archive import ReportArchive, month_start, months_in_range
+from config import (
+    ARCHIVE_DIR, ARCHIVE_KEEP_MONTHS, COMPACTION_JOURNAL_RECORDS, COMPACTION_TOMBSTONE_RATIO, DATABASE_FILE,
+    ERRORS_MASK_COLUMN, INITIAL_USERS, JOURNAL_FSYNC, REPORT_ID_COLUMN, REPORTS_CHUNK_SIZE, REPORTS_COLUMNS, REPORTS_FILE,
+    REPORTS_JOURNAL, REPORTS_PAGE_SIZE, SOURCE_ID_COLUMN, STORAGE_BACKEND, SUMMARY_FILE, SUMMARY_JOURNAL, TIME_COLUMNS,
+    USERS_COLUMNS, USERS_FILE, tz
+)
+from error_codes import error_masks
+from journal import append_records, read_records, recover_journal, replace_records
+from store_lock import StoreLock, StoreLockedError
+from summaries import (
+    COUNT_COLUMNS, LAST_ACTIVITY_COLUMN, SUMMARY_COLUMNS, SUMMARY_KEYS, apply_summary, empty_summary,
+    summaries_equal, summarize_reports
+)
+from timestamps import has_legacy_times, local_day_end, local_day_start, parse_times
+
+
+@dataclass
+class ReportQuery:
+    """
+    Filters, sort order and page of a reports query. Dates are inclusive and
+    compared against the report's start time; `error` must be an ERRORS_LIST entry.
+    """
+    start_date: date = None
+    end_date: date = None
+    username: str = None
+    vehicle_number: str = None
+    name_contains: str = None
+    error: str = None
+    sort_by: str = "وقت البداية"
+    descending: bool = True
+    offset: int = 0
+    limit: int = REPORTS_PAGE_SIZE
+
+
+def _date_bounds(query):
+    """Returns the [low, high) start times, in epoch seconds, of the query's local date range."""
+    low = local_day_start(query.start_date) if query.start_date else None
+    high = local_day_end(query.end_date) if query.end_date else None
+    return low, high
+
+
+def _typed_times(df):
+    """Converts the time columns of a reports DataFrame to Int64 epoch seconds, in place."""
+    for col in TIME_COLUMNS:
+        df[col] = parse_times(df[col]) if len(df) else pd.Series(dtype="Int64")
+    return df
+
+
+def _normalize_times(reports):
+    """Returns copies of report dicts with their times as epoch-second strings."""
+    times = {col: parse_times([report.get(col) for report in reports]) for col in TIME_COLUMNS}
+    return [
+        {**report, **{col: None if pd.isna(times[col][i]) else str(times[col][i]) for col in TIME_COLUMNS}}
+        for i, report in enumerate(reports)
+    ]
+
+
+def filter_reports(df, query):
+    """Returns the rows of a reports DataFrame (with typed times) that match the query's filters."""
+    mask = pd.Series(True, index=df.index)
+    low, high = _date_bounds(query)
+    if low is not None:
+        mask &= (df["وقت البداية"] >= low).fillna(False).astype(bool)
+    if high is not None:
+        mask &= (df["وقت البداية"] < high).fillna(False).astype(bool)
+    if query.username:
+        mask &= df["اسم المستخدم"] == query.username
+    if query.vehicle_number:
+        mask &= df["رقم المركبة"] == query.vehicle_number
+    if query.name_contains:
+        mask &= df["اسم التقرير"].fillna("").str.contains(query.name_contains, case=False, regex=False)
+    if query.error:
+        # Errors are stored as "a; b; c", so wrap both sides to match whole entries only
+        mask &= ("; " + df["الأخطاء"].fillna("") + "; ").str.contains(f"; {query.error}; ", regex=False)
+    return df[mask]
+
+
+def _sort_reports(df, sort_by, descending):
+    """Sorts reports by a column, ties by ID, in the same direction, as the SQLite backend does."""
+    order = pd.to_numeric(df[REPORT_ID_COLUMN], errors="coerce")
+    return (df.assign(_order=order)
+            .sort_values([sort_by, "_order"], ascending=not descending, kind="stable", na_position="last")
+            .drop(columns="_order"))
+
+
+def archive_cutoff(keep_months=ARCHIVE_KEEP_MONTHS):
+    """
+    Returns the epoch time before which reports are archived: the start of
+    the local month `keep_months` months before the current one.
+    """
+    now = datetime.now(tz)
+    months = now.year * 12 + now.month - 1 - keep_months
+    return month_start(f"{months // 12}-{months % 12 + 1:02d}")
+
+
+class StorageBackend:
+    """Interface shared by every storage engine."""
+
+    def ensure_ready(self):
+        """Creates the underlying files/tables and the initial users if missing."""
+        raise NotImplementedError
+
+    def get_user(self, username):
+        """Returns the user matching `username` case-insensitively, or None."""
+        raise NotImplementedError
+
+    def users_version(self):
+        """Returns a cheap token that changes whenever the users are modified."""
+        raise NotImplementedError
+
+    def list_users(self):
+        """Returns all users as a DataFrame with USERS_COLUMNS."""
+        raise NotImplementedError
+
+    def reports_version(self):
+        """Returns a number that grows whenever reports are saved, deleted or archived."""
+        raise NotImplementedError
+
+    def add_user(self, user):
+        """Adds a user. Returns False if the username is already taken."""
+        return self.add_users([user])[0]
+
+    def add_users(self, users):
+        """
+        Adds many users in one atomic write. Usernames already taken (ignoring
+        letter case), including earlier in the same list, are skipped.
+        Returns one boolean per user telling whether it was added.
+        """
+        raise NotImplementedError
+
+    def update_users(self, changes):
+        """
+        Applies `changes` ({username: {column: value}}) to many users in one
+        atomic write. Users that are not listed are left untouched.
+        """
+        raise NotImplementedError
+
+    def append_report(self, report):
+        """Stores a new report and returns the ID it was given."""
+        return self.append_reports([report])[0]
+
+    def append_reports(self, reports):
+        """
+        Stores many reports in one write and returns the IDs they were given.
+        Every report gets the next ID of this store, whatever its dict holds.
+        """
+        raise NotImplementedError
+
+    def stored_source_keys(self, keys):
+        """
+        Returns those of `keys`, (username, source ID) pairs of imported
+        reports (see importer.py), that belong to a stored report, live or archived.
+        """
+        keys = set(keys)
+        found = self._stored_live_source_keys(keys) if keys else set()
+        rest = keys - found
+        if rest:
+            archived = self.archive.read(
+                columns=["اسم المستخدم", SOURCE_ID_COLUMN],
+                filters=[(SOURCE_ID_COLUMN, "in", sorted({source_id for _, source_id in rest}))]
+            )
+            found |= rest.intersection(zip(archived["اسم المستخدم"], archived[SOURCE_ID_COLUMN]))
+        return found
+
+    def _stored_live_source_keys(self, keys):
+        """Returns those of `keys` (a set of (username, source ID) pairs) that are in the live store."""
+        raise NotImplementedError
+
+    def load_reports(self, username=None):
+        """
+        Returns the reports, archived ones first, as a DataFrame with
+        REPORTS_COLUMNS, optionally for one owner only.
+        """
+        archived = self.archive.read(filters=[("اسم المستخدم", "==", username)] if username is not None else None)
+        live = self._load_live(username)
+        if archived.empty:
+            return live
+        return pd.concat([archived, live], ignore_index=True)
+
+    def _load_live(self, username=None, before=None):
+        """
+        Returns the reports of the live store, optionally for one owner only
+        and only those that started before the epoch time `before`.
+        """
+        raise NotImplementedError
+
+    def query_reports(self, query):
+        """
+        Returns (page, total): the requested page of reports matching `query`
+        as a DataFrame with REPORTS_COLUMNS, and the number of matching reports.
+        """
+        months = months_in_range(self.archive.months(), *_date_bounds(query))
+        if not months:
+            return self._query_live(query)
+        # Each side returns its first offset + limit rows; the page is cut from the merge
+        window = replace(query, offset=0, limit=query.offset + query.limit)
+        live, live_total = self._query_live(window)
+        archived, archived_total = self._query_archive(window, months)
+        df = _sort_reports(pd.concat([live, archived], ignore_index=True), query.sort_by, query.descending)
+        return df.iloc[query.offset:query.offset + query.limit].reset_index(drop=True), live_total + archived_total
+
+    def _query_live(self, query):
+        """Same as `query_reports`, for the live store only."""
+        raise NotImplementedError
+
+    def _query_archive(self, query, months):
+        """Same as `query_reports`, for the given archived months only."""
+        filters = []
+        if query.username:
+            filters.append(("اسم المستخدم", "==", query.username))
+        if query.vehicle_number:
+            filters.append(("رقم المركبة", "==", query.vehicle_number))
+        low, high = _date_bounds(query)
+        if low is not None:
+            filters.append(("وقت البداية", ">=", low))
+        if high is not None:
+            filters.append(("وقت البداية", "<", high))
+        # The first pass reads only the columns needed to filter and sort...
+        columns = [REPORT_ID_COLUMN, "وقت البداية", query.sort_by, "اسم المستخدم", "رقم المركبة"]
+        if query.name_contains:
+            columns.append("اسم التقرير")
+        if query.error:
+            columns.append("الأخطاء")
+        keys = filter_reports(self.archive.read(months, list(dict.fromkeys(columns)), filters or None), query)
+        total = len(keys)
+        keys = _sort_reports(keys, query.sort_by, query.descending).iloc[query.offset:query.offset + query.limit]
+        if keys.empty:
+            return self.archive.read([]), total
+        # ...and the second reads whole rows, only for the reports on the page and their months
+        page_months = sorted(set(months_in_range(months, int(keys["وقت البداية"].min()), int(keys["وقت البداية"].max()) + 1)))
+        rows = self.archive.read(page_months, filters=[(REPORT_ID_COLUMN, "in", list(keys[REPORT_ID_COLUMN]))])
+        rows = rows.set_index(REPORT_ID_COLUMN, drop=False).loc[keys[REPORT_ID_COLUMN]].reset_index(drop=True)
+        return rows, total
+
+    def delete_report(self, report_id):
+        """Deletes the report with the given ID."""
+        self.delete_reports([report_id])
+
+    def delete_reports(self, report_ids):
+        """Deletes the reports with the given IDs in one write."""
+        raise NotImplementedError
+
+    def archive_reports(self, before=None):
+        """
+        Moves the live reports that started before the epoch time `before`
+        (by default `archive_cutoff()`) into the archive. The reports are
+        written to the archive before they leave the live store, and the
+        archive skips reports it already holds, so running it again after a
+        crash finishes the move. Returns the number of reports moved.
+        """
+        df = self._load_live(before=archive_cutoff() if before is None else before)
+        if df.empty:
+            return 0
+        self.archive.write(df)
+        self._remove_live(list(df[REPORT_ID_COLUMN]))
+        return len(df)
+
+    def _remove_live(self, report_ids):
+        """Removes reports from the live store without changing the summary table."""
+        raise NotImplementedError
+
+    def needs_archive(self):
+        """Returns True when the live store holds reports old enough to be archived."""
+        oldest = self._oldest_live_start()
+        return oldest is not None and oldest < archive_cutoff()
+
+    def _oldest_live_start(self):
+        """Returns the earliest start time in the live store, or None."""
+        raise NotImplementedError
+
+    def load_summary(self):
+        """Returns the summary table of all reports, live and archived (see summaries.py)."""
+        raise NotImplementedError
+
+    def rebuild_summary(self):
+        """
+        Recomputes the summary table from all reports and stores it. Returns
+        True if the stored table already matched.
+        """
+        raise NotImplementedError
+
+    def needs_compaction(self):
+        """Returns True when enough reports were deleted or appended to make `compact` worth running."""
+        return False
+
+    def compact(self):
+        """Rewrites the reports store without the space held by deleted reports."""
+
+
+# ------------------------------
+# CSV Backend
+# ------------------------------
+# Key of the journal records that mark a report as deleted
+TOMBSTONE_KEY = "deleted_id"
+# Key of the record compaction starts the journal with: the next report ID, which
+# the reports left may no longer show once the ones with the highest IDs are gone
+NEXT_ID_KEY = "next_id"
+
+# What the summary table is computed from, kept in memory for every live report of the CSV backend
+SUMMARY_SOURCE_COLUMNS = ["اسم المستخدم", "رقم المركبة", "وقت البداية", "وقت النهاية", ERRORS_MASK_COLUMN]
+
+
+def _summary_sources(df):
+    """Returns {report ID: (username, vehicle, start, end, error mask)} for the reports of a DataFrame."""
+    df = df[df[REPORT_ID_COLUMN].notna()]
+    if df.empty:
+        return {}
+    values = zip(
+        df["اسم المستخدم"].fillna("").astype(str),
+        df["رقم المركبة"].fillna("").astype(str),
+        parse_times(df["وقت البداية"]).tolist(),
+        parse_times(df["وقت النهاية"]).tolist(),
+        error_masks(df).tolist()
+    )
+    return dict(zip(df[REPORT_ID_COLUMN].astype(str), values))
+
+
+def _source_key_hashes(usernames, source_ids):
+    """
+    Returns 64-bit hashes of (username, source ID) pairs. The CSV backend keeps
+    these instead of the pairs; a collision, which would make the importer skip
+    a new report as already imported, is vanishingly unlikely at 64 bits.
+    """
+    pairs = pd.DataFrame({"username": list(usernames), "source_id": list(source_ids)}, dtype=object)
+    return pd.util.hash_pandas_object(pairs, index=False).to_numpy(dtype=np.uint64)
+
+
+def _summary_source_frame(sources):
+    """Turns (username, vehicle, start, end, error mask) tuples into a DataFrame `summarize_reports` accepts."""
+    df = pd.DataFrame(list(sources), columns=SUMMARY_SOURCE_COLUMNS)
+    return df.astype({col: "Int64" for col in TIME_COLUMNS})
+
+
+def _summary_records(delta, sign):
+    """Turns summary rows into records of the summary journal."""
+    keys = delta[SUMMARY_KEYS].astype(str).to_numpy().tolist()
+    counts = delta[COUNT_COLUMNS].to_numpy(dtype="int64").tolist()
+    last = [None if pd.isna(value) else int(value) for value in delta[LAST_ACTIVITY_COLUMN]]
+    return [{"s": sign, "k": k, "c": c, "l": l} for k, c, l in zip(keys, counts, last)]
+
+
+def _summary_from_records(records):
+    """Turns records of the summary journal back into summary rows."""
+    df = pd.DataFrame([r["k"] + r["c"] + [r["l"]] for r in records], columns=SUMMARY_COLUMNS)
+    return df.astype({**{col: "int64" for col in COUNT_COLUMNS}, LAST_ACTIVITY_COLUMN: "Int64"})
+
+
+def _write_csv_atomic(df, path):
+    """Writes a DataFrame to a temporary file and moves it over `path` in one step."""
+    tmp_path = path + ".tmp"
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+class CsvBackend(StorageBackend):
+    """Stores users in users.csv and reports in reports.csv plus the reports journal."""
+
+    def __init__(self, users_file=USERS_FILE, reports_file=REPORTS_FILE,
+                 reports_journal=REPORTS_JOURNAL, fsync=JOURNAL_FSYNC, summary_file=SUMMARY_FILE,
+                 archive_dir=ARCHIVE_DIR, summary_journal=SUMMARY_JOURNAL):
+        self.users_file = users_file
+        self.reports_file = reports_file
+        self.reports_journal = reports_journal
+        self.fsync = fsync
+        self.summary_file = summary_file
+        self.summary_journal = summary_journal
+        self.archive = ReportArchive(archive_dir)
+        # Guards the report counters and summary below; writes normally all come from the writer thread
+        self._lock = threading.RLock()
+        self._stats = None
+        self._sources = None
+        self._source_index = None
+        self._summary = None
+        # Only this process writes the store (see store_lock.py), so counting its writes
+        # in memory is enough to tell when the reports changed
+        self._reports_version = 0
+
+    def ensure_ready(self):
+        if not os.path.exists(self.reports_file):
+            pd.DataFrame(columns=REPORTS_COLUMNS).to_csv(self.reports_file, index=False)
+        # Drop a report left half-written by a crash so new appends start on a clean line
+        recover_journal(self.reports_journal)
+        recover_journal(self.summary_journal)
+        # Reports saved before reports had IDs or epoch times are rewritten, once per process
+        if self._stats is None:
+            self.archive.recover()
+            self._ensure_current_format()
+            self._ensure_summary()
+        if not os.path.exists(self.users_file):
+            pd.DataFrame(INITIAL_USERS, columns=USERS_COLUMNS).to_csv(self.users_file, index=False)
+
+    def _read_users(self):
+        return pd.read_csv(self.users_file, dtype=str, keep_default_na=False)
+
+    def get_user(self, username):
+        df = self._read_users()
+        match = df[df["username"].str.strip().str.lower() == username.strip().lower()]
+        if match.empty:
+            return None
+        return {col: str(value).strip() for col, value in match.iloc[0].items()}
+
+    def users_version(self):
+        # A rewrite replaces the file, so the inode changes even within the mtime resolution
+        st_users = os.stat(self.users_file)
+        return (st_users.st_ino, st_users.st_mtime_ns, st_users.st_size)
+
+    def reports_version(self):
+        return self._reports_version
+
+    def list_users(self):
+        return self._read_users().reindex(columns=USERS_COLUMNS)
+
+    def add_users(self, users):
+        df = self._read_users()
+        taken = set(df["username"].str.strip().str.lower())
+        added = []
+        for user in users:
+            key = str(user["username"]).strip().lower()
+            added.append(key not in taken)
+            taken.add(key)
+        new_rows = pd.DataFrame([u for u, ok in zip(users, added) if ok], columns=USERS_COLUMNS)
+        if not new_rows.empty:
+            _write_csv_atomic(pd.concat([df, new_rows], ignore_index=True), self.users_file)
+        return added
+
+    def update_users(self, changes):
+        if not changes:
+            return
+        df = self._read_users()
+        for i in df.index[df["username"].isin(list(changes))]:
+            for col, value in changes[df.at[i, "username"]].items():
+                df.at[i, col] = str(value)
+        _write_csv_atomic(df, self.users_file)
+
+    # Reports live in two places: the compacted CSV file and the journal of
+    # what happened since. The journal holds new reports and tombstones
+    # ({TOMBSTONE_KEY: id}) marking deleted reports; readers skip tombstoned
+    # IDs, and `compact` folds everything back into the CSV file and starts
+    # the journal again with the next report ID ({NEXT_ID_KEY: id}).
+
+    def _report_stats(self):
+        """
+        Returns the counters used to give out IDs and to decide when to compact,
+        computing them once from the stored reports, one chunk at a time.
+        """
+        with self._lock:
+            if self._stats is None:
+                journal_df, deleted, next_id = self._read_journal()
+                ids = pd.to_numeric(journal_df[REPORT_ID_COLUMN], errors="coerce")
+                highest = [ids.max(), pd.to_numeric(pd.Series(sorted(deleted), dtype=object), errors="coerce").max()]
+                rows, missing_ids = len(ids), bool(ids.isna().any())
+                legacy_times = has_legacy_times(journal_df["وقت البداية"])
+                for chunk in self._read_reports_file(chunksize=REPORTS_CHUNK_SIZE):
+                    chunk = chunk.reindex(columns=REPORTS_COLUMNS)
+                    ids = pd.to_numeric(chunk[REPORT_ID_COLUMN], errors="coerce")
+                    highest.append(ids.max())
+                    rows += len(ids)
+                    missing_ids = missing_ids or bool(ids.isna().any())
+                    legacy_times = legacy_times or has_legacy_times(chunk["وقت البداية"])
+                # Archived reports keep their IDs, so new IDs must be above theirs too
+                for month in self.archive.months():
+                    highest.append(pd.to_numeric(self.archive.read([month], columns=[REPORT_ID_COLUMN])[REPORT_ID_COLUMN], errors="coerce").max())
+                highest = pd.Series(highest, dtype="float64").max()
+                self._stats = {
+                    "next_id": max(next_id, 1 if pd.isna(highest) else int(highest) + 1),
+                    "rows": rows,
+                    "tombstones": len(deleted),
+                    "journal_records": len(journal_df) + len(deleted),
+                    "missing_ids": missing_ids,
+                    "legacy_times": legacy_times
+                }
+            return self._stats
+
+    def _live_sources(self):
+        """
+        Returns {report ID: summary source} for every live report, so a delete
+        can update the summary without reading the reports again. It is read
+        on first use: the app's writer needs it for its first archive check,
+        while processes that only append, like the importer, never build it.
+        """
+        with self._lock:
+            if self._sources is None:
+                journal_df, deleted, _ = self._read_journal()
+                sources = {}
+                for chunk in self._read_reports_file(chunksize=REPORTS_CHUNK_SIZE):
+                    sources.update(_summary_sources(chunk.reindex(columns=REPORTS_COLUMNS)))
+                # Journal rows win over the CSV file and tombstones over both, as for readers
+                sources.update(_summary_sources(journal_df))
+                for report_id in deleted:
+                    sources.pop(report_id, None)
+                self._sources = sources
+            return self._sources
+
+    def _ensure_current_format(self):
+        """
+        Compacts the store if some reports were saved before reports had IDs or
+        before times were stored as epoch seconds; compaction rewrites both.
+        """
+        with self._lock:
+            stats = self._report_stats()
+            if stats["missing_ids"] or stats["legacy_times"]:
+                self.compact()
+
+    def _read_journal(self):
+        """
+        Returns the reports in the journal as a DataFrame, the set of tombstoned
+        IDs, and the next report ID recorded by the last compaction (1 if none).
+        """
+        rows, deleted, next_id = [], set(), 1
+        for record in read_records(self.reports_journal):
+            if TOMBSTONE_KEY in record:
+                deleted.add(str(record[TOMBSTONE_KEY]))
+            elif NEXT_ID_KEY in record:
+                next_id = int(record[NEXT_ID_KEY])
+            else:
+                rows.append(record)
+        return pd.DataFrame(rows, columns=REPORTS_COLUMNS, dtype=str), deleted, next_id
+
+    def append_reports(self, reports):
+        with self._lock:
+            summary = self.load_summary()
+            stats = self._report_stats()
+            ids = list(range(stats["next_id"], stats["next_id"] + len(reports)))
+            stats["next_id"] += len(reports)
+            records = [{**report, REPORT_ID_COLUMN: str(report_id)} for report, report_id in zip(_normalize_times(reports), ids)]
+            append_records(self.reports_journal, records, fsync=self.fsync)
+            stats["rows"] += len(reports)
+            stats["journal_records"] += len(reports)
+            if stats.get("oldest_start") is not None:
+                starts = parse_times([record.get("وقت البداية") for record in records]).dropna()
+                if len(starts):
+                    stats["oldest_start"] = min(stats["oldest_start"], int(starts.min()))
+            new_reports = pd.DataFrame(records, columns=REPORTS_COLUMNS, dtype=str)
+            if self._sources is not None:
+                self._sources.update(_summary_sources(new_reports))
+            if self._source_index is not None:
+                imported = new_reports[new_reports[SOURCE_ID_COLUMN].notna()]
+                self._source_index = np.union1d(self._source_index, _source_key_hashes(imported["اسم المستخدم"], imported[SOURCE_ID_COLUMN]))
+            self._add_summary(summary, summarize_reports(_typed_times(new_reports)), sign=1)
+            self._reports_version += 1
+            return ids
+
+    def delete_reports(self, report_ids):
+        with self._lock:
+            summary = self.load_summary()
+            sources = self._live_sources()
+            # The deleted reports are looked up in memory to take them out of the summary;
+            # IDs that are unknown or already deleted are not found, so nothing is
+            # subtracted twice. Reports that are not in the live store may be in the archive
+            wanted = {str(i) for i in report_ids}
+            live_ids = [i for i in wanted if i in sources]
+            live = _summary_source_frame(sources[i] for i in live_ids)
+            if live_ids:
+                self._remove_live(live_ids)
+            archived = self.archive.delete(wanted.difference(live_ids))
+            archived = archived.assign(**{ERRORS_MASK_COLUMN: error_masks(archived)}).reindex(columns=SUMMARY_SOURCE_COLUMNS)
+            delta = summarize_reports(pd.concat([live, archived], ignore_index=True))
+            self._add_summary(summary, delta, sign=-1)
+            self._reports_version += 1
+
+    def _remove_live(self, report_ids):
+        with self._lock:
+            stats = self._report_stats()
+            append_records(self.reports_journal, [{TOMBSTONE_KEY: str(i)} for i in report_ids], fsync=self.fsync)
+            stats["tombstones"] += len(report_ids)
+            stats["journal_records"] += len(report_ids)
+            if self._sources is not None:
+                for report_id in report_ids:
+                    self._sources.pop(str(report_id), None)
+            # Recomputed by the next call to _oldest_live_start and _stored_live_source_keys
+            stats.pop("oldest_start", None)
+            self._source_index = None
+            self._reports_version += 1
+
+    def _oldest_live_start(self):
+        with self._lock:
+            stats = self._report_stats()
+            if "oldest_start" not in stats:
+                starts = [start for _, _, start, _, _ in self._live_sources().values() if not pd.isna(start)]
+                stats["oldest_start"] = int(min(starts)) if starts else None
+            return stats["oldest_start"]
+
+    # The summary is derived from the reports, so it is written after them; if the
+    # process dies in between, the row count no longer matches and it is rebuilt.
+    # Every write of reports appends its change to the summary journal, and
+    # compaction folds the journal back into the summary file.
+
+    def _read_summary(self):
+        if not os.path.exists(self.summary_file):
+            return None
+        df = pd.read_csv(self.summary_file, dtype={key: str for key in SUMMARY_KEYS}, keep_default_na=False)
+        df = df.reindex(columns=SUMMARY_COLUMNS)
+        df[COUNT_COLUMNS] = df[COUNT_COLUMNS].fillna(0).astype("int64")
+        df[LAST_ACTIVITY_COLUMN] = pd.to_numeric(df[LAST_ACTIVITY_COLUMN], errors="coerce").astype("Int64")
+        # Changes are replayed in order, one run of additions or subtractions at a time
+        batch = []
+        for record in read_records(self.summary_journal):
+            if batch and record["s"] != batch[0]["s"]:
+                df = apply_summary(df, _summary_from_records(batch), batch[0]["s"])
+                batch = []
+            batch.append(record)
+        if batch:
+            df = apply_summary(df, _summary_from_records(batch), batch[0]["s"])
+        return df
+
+    def _store_summary(self, summary):
+        # A crash between these two steps replays the journal onto a file that already
+        # holds it; the row count then no longer matches and the summary is rebuilt
+        _write_csv_atomic(summary, self.summary_file)
+        open(self.summary_journal, "w").close()
+        self._summary = summary
+
+    def _add_summary(self, summary, delta, sign):
+        """Adds (sign=1) or subtracts (sign=-1) summary rows with one append to the summary journal."""
+        if delta.empty:
+            return
+        append_records(self.summary_journal, _summary_records(delta, sign), fsync=self.fsync)
+        self._summary = apply_summary(summary, delta, sign)
+
+    def _ensure_summary(self):
+        """Rebuilds the summary file if it is missing or does not cover the live reports."""
+        with self._lock:
+            stats = self._report_stats()
+            summary = self._read_summary()
+            expected = stats["rows"] - stats["tombstones"] + self.archive.count()
+            # Repeated keys were left by an older version that replayed the journal without merging them
+            if (summary is None or summary[COUNT_COLUMNS[0]].sum() != expected
+                    or summary.duplicated(SUMMARY_KEYS).any()):
+                self.rebuild_summary()
+            else:
+                self._summary = summary
+
+    def load_summary(self):
+        with self._lock:
+            if self._summary is None:
+                self._summary = self._read_summary()
+                if self._summary is None:
+                    self.rebuild_summary()
+            return self._summary
+
+    def rebuild_summary(self):
+        with self._lock:
+            rebuilt = summarize_reports(self.load_reports())
+            stored = self._summary if self._summary is not None else self._read_summary()
+            self._store_summary(rebuilt)
+            return stored is not None and summaries_equal(stored, rebuilt)
+
+    def needs_compaction(self):
+        stats = self._report_stats()
+        return (stats["tombstones"] > COMPACTION_TOMBSTONE_RATIO * max(stats["rows"], 1)
+                or stats["journal_records"] > COMPACTION_JOURNAL_RECORDS)
+
+    def compact(self):
+        with self._lock:
+            stats = self._report_stats()
+            df = self._load_live()
+            # Reports saved before IDs existed get the next free IDs, in their stored order.
+            # A file without the ID column reads it back as float NaN, which cannot hold strings
+            df[REPORT_ID_COLUMN] = df[REPORT_ID_COLUMN].astype(object)
+            missing = df[REPORT_ID_COLUMN].isna()
+            df.loc[missing, REPORT_ID_COLUMN] = [str(i) for i in range(stats["next_id"], stats["next_id"] + int(missing.sum()))]
+            _write_csv_atomic(df, self.reports_file)
+            # The new CSV file already holds the journal; readers ignore any journal
+            # row that is also in the CSV file, so a crash between these two steps is safe
+            next_id = stats["next_id"] + int(missing.sum())
+            replace_records(self.reports_journal, [{NEXT_ID_KEY: next_id}], fsync=self.fsync)
+            if self._sources is not None:
+                self._sources = _summary_sources(df)
+            self._store_summary(self.load_summary())
+            stats.update({
+                "next_id": next_id,
+                "rows": len(df),
+                "tombstones": 0,
+                "journal_records": 0,
+                "missing_ids": False,
+                "legacy_times": False
+            })
+            self._reports_version += 1
+
+    def _read_reports_file(self, **kwargs):
+        if not os.path.exists(self.reports_file):
+            return [pd.DataFrame(columns=REPORTS_COLUMNS)] if kwargs.get("chunksize") else pd.DataFrame(columns=REPORTS_COLUMNS)
+        return pd.read_csv(self.reports_file, dtype=str, **kwargs)
+
+    def _iter_report_chunks(self):
+        """Yields the live reports as DataFrames of at most REPORTS_CHUNK_SIZE rows."""
+        # The journal is read before the CSV file: if a compaction replaces the file
+        # in between, the journal's rows are found in both and skipped in the CSV file
+        journal_df, deleted, _ = self._read_journal()
+        hidden = deleted | set(journal_df[REPORT_ID_COLUMN].dropna())
+        for chunk in self._read_reports_file(chunksize=REPORTS_CHUNK_SIZE):
+            chunk = chunk.reindex(columns=REPORTS_COLUMNS)
+            yield _typed_times(chunk[~chunk[REPORT_ID_COLUMN].isin(hidden)].copy())
+        journal_df = journal_df[~journal_df[REPORT_ID_COLUMN].isin(deleted)]
+        for start in range(0, len(journal_df), REPORTS_CHUNK_SIZE):
+            yield _typed_times(journal_df.iloc[start:start + REPORTS_CHUNK_SIZE].copy())
+
+    def _stored_live_source_keys(self, keys):
+        with self._lock:
+            if self._source_index is None:
+                # Built on first use, which only the importer makes; it holds one hash per imported report
+                parts = [np.empty(0, dtype=np.uint64)]
+                for chunk in self._iter_report_chunks():
+                    chunk = chunk[chunk[SOURCE_ID_COLUMN].notna()]
+                    parts.append(_source_key_hashes(chunk["اسم المستخدم"], chunk[SOURCE_ID_COLUMN]))
+                self._source_index = np.unique(np.concatenate(parts))
+            keys = list(keys)
+            hashes = _source_key_hashes([key[0] for key in keys], [key[1] for key in keys])
+            return {key for key, hit in zip(keys, np.isin(hashes, self._source_index)) if hit}
+
+    def _load_live(self, username=None, before=None):
+        chunks = [c if username is None else c[c["اسم المستخدم"] == username] for c in self._iter_report_chunks()]
+        if before is not None:
+            chunks = [c[(c["وقت البداية"] < before).fillna(False).astype(bool)] for c in chunks]
+        chunks = [c for c in chunks if not c.empty]
+        if not chunks:
+            return _typed_times(pd.DataFrame(columns=REPORTS_COLUMNS))
+        return pd.concat(chunks, ignore_index=True)
+
+    def _query_live(self, query):
+        # Only the matching rows of each chunk are kept in memory
+        matches = [filter_reports(chunk, query) for chunk in self._iter_report_chunks()]
+        matches = [m for m in matches if not m.empty]
+        if not matches:
+            return _typed_times(pd.DataFrame(columns=REPORTS_COLUMNS)), 0
+        df = pd.concat(matches, ignore_index=True)
+        if query.descending:
+            # Reverse first so that ties are listed newest first, like the SQLite backend
+            df = df.iloc[::-1]
+        df = df.sort_values(query.sort_by, ascending=not query.descending, kind="stable", na_position="last")
+        return df.iloc[query.offset:query.offset + query.limit].reset_index(drop=True), len(df)
+
+
+# ------------------------------
+# SQLite Backend
+# ------------------------------
+# SQL column names of the reports table, in the same order as REPORTS_COLUMNS
+REPORT_FIELDS = ["id", "report_name", "started_at", "ended_at", "errors", "notes", "username", "vehicle_number", "errors_mask", "error_events", "source_id"]
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    username_lower TEXT NOT NULL,
+    password TEXT,
+    role TEXT,
+    evaluator_access TEXT,
+    name TEXT,
+    vehicle_number TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users (username_lower);
+
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    report_name TEXT,
+    started_at INTEGER,
+    ended_at INTEGER,
+    errors TEXT,
+    notes TEXT,
+    username TEXT,
+    vehicle_number TEXT,
+    errors_mask INTEGER,
+    error_events TEXT,
+    source_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_reports_username ON reports (username);
+CREATE INDEX IF NOT EXISTS idx_reports_vehicle_number ON reports (vehicle_number);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# SQL column names of the summary table, in the same order as SUMMARY_COLUMNS
+SUMMARY_FIELDS = ["username", "vehicle_number", "day", "reports"] + [f"e{i}" for i in range(len(COUNT_COLUMNS) - 1)] + ["last_activity"]
+
+SQLITE_SUMMARY_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS report_summary (
+    username TEXT NOT NULL,
+    vehicle_number TEXT NOT NULL,
+    day TEXT NOT NULL,
+    {" ".join(f"{field} INTEGER NOT NULL DEFAULT 0," for field in SUMMARY_FIELDS[3:-1])}
+    last_activity INTEGER,
+    PRIMARY KEY (username, vehicle_number, day)
+);
+"""
+
+# Adds a summary row to the stored one, or inserts it
+SQLITE_SUMMARY_UPSERT = (
+    f"INSERT INTO report_summary ({', '.join(SUMMARY_FIELDS)}) VALUES ({', '.join('?' * len(SUMMARY_FIELDS))}) "
+    "ON CONFLICT (username, vehicle_number, day) DO UPDATE SET "
+    + ", ".join(f"{field} = {field} + excluded.{field}" for field in SUMMARY_FIELDS[3:-1])
+    + ", last_activity = COALESCE(MAX(last_activity, excluded.last_activity), last_activity, excluded.last_activity)"
+)
+
+# Indexes on columns that older databases only get from the migration in `ensure_ready`
+SQLITE_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_reports_started_at ON reports (started_at);
+CREATE INDEX IF NOT EXISTS idx_reports_source_id ON reports (source_id, username) WHERE source_id IS NOT NULL;
+DROP INDEX IF EXISTS idx_reports_start_time;
+"""
+
+
+def _bump_version(conn, key):
+    """Increments a change counter in the meta table, inside the caller's transaction."""
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, 1) ON CONFLICT (key) DO UPDATE SET value = value + 1",
+        (key,)
+    )
+
+
+def _user_row(user):
+    """Converts a user dict into the values of an INSERT into the users table."""
+    username = str(user["username"]).strip()
+    return (username, username.lower()) + tuple(
+        "" if pd.isna(user.get(col)) else str(user.get(col)).strip() for col in USERS_COLUMNS[1:]
+    )
+
+
+def _apply_summary(conn, delta, sign=1):
+    """Adds (sign=1) or subtracts (sign=-1) summary rows, inside the caller's transaction."""
+    if delta.empty:
+        return
+    rows = []
+    for row in delta.itertuples(index=False):
+        counts = [int(value) * sign for value in row[3:-1]]
+        # Deleting a report does not move the latest activity back
+        last = None if sign < 0 or pd.isna(row[-1]) else int(row[-1])
+        rows.append(tuple(row[:3]) + tuple(counts) + (last,))
+    conn.executemany(SQLITE_SUMMARY_UPSERT, rows)
+    conn.execute("DELETE FROM report_summary WHERE reports <= 0")
+
+
+def _report_row(report):
+    """Converts a report dict into the values of an INSERT into the reports table."""
+    return tuple(None if pd.isna(report.get(col)) else str(report.get(col)) for col in REPORTS_COLUMNS)
+
+
+class SqliteBackend(StorageBackend):
+    """Stores users and reports in one SQLite database."""
+
+    def __init__(self, path=DATABASE_FILE, archive_dir=ARCHIVE_DIR):
+        self.path = path
+        self.archive = ReportArchive(archive_dir)
+        # sqlite3 connections cannot be shared between threads, so each Streamlit thread gets its own
+        self._local = threading.local()
+        # Guards the one-time setup below, which every Streamlit rerun asks for
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def ensure_ready(self):
+        # Runs once per process: the archive is only recovered before the writer thread
+        # can be in the middle of rewriting a month
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            conn = self._connect()
+            self._ensure_schema(conn)
+            self.archive.recover()
+            if conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None:
+                if os.path.exists(USERS_FILE):
+                    migrate_csv_to_sqlite(self)
+                else:
+                    self.add_users(INITIAL_USERS)
+            self._ready = True
+
+    def _ensure_schema(self, conn):
+        """Creates the tables, and brings databases created by older versions up to date."""
+        conn.executescript(SQLITE_SCHEMA)
+        report_columns = {row[1] for row in conn.execute("PRAGMA table_info(reports)")}
+        for column, column_type in (("started_at", "INTEGER"), ("ended_at", "INTEGER"),
+                                    ("errors_mask", "INTEGER"), ("error_events", "TEXT"), ("source_id", "TEXT")):
+            if column not in report_columns:
+                conn.execute(f"ALTER TABLE reports ADD COLUMN {column} {column_type}")
+        if "start_time" in report_columns:
+            self._convert_legacy_times(conn)
+        conn.executescript(SQLITE_INDEXES)
+        conn.executescript(SQLITE_SUMMARY_SCHEMA)
+        # Databases created before the summary table existed get it filled once
+        if (conn.execute("SELECT 1 FROM report_summary LIMIT 1").fetchone() is None
+                and conn.execute("SELECT 1 FROM reports LIMIT 1").fetchone() is not None):
+            self.rebuild_summary()
+
+    @staticmethod
+    def _convert_legacy_times(conn):
+        """
+        Fills started_at/ended_at of reports saved with local-time strings in the
+        old start_time/end_time columns. Rows already converted are not read again.
+        """
+        rows = conn.execute(
+            "SELECT id, start_time, end_time FROM reports "
+            "WHERE started_at IS NULL AND ended_at IS NULL AND (start_time IS NOT NULL OR end_time IS NOT NULL)"
+        ).fetchall()
+        if not rows:
+            return
+        df = pd.DataFrame(rows, columns=["id", "start_time", "end_time"])
+        started, ended = parse_times(df["start_time"]), parse_times(df["end_time"])
+        with conn:
+            conn.executemany(
+                "UPDATE reports SET started_at = ?, ended_at = ? WHERE id = ?",
+                [(None if pd.isna(s) else int(s), None if pd.isna(e) else int(e), int(i))
+                 for s, e, i in zip(started, ended, df["id"])]
+            )
+
+    def add_users(self, users):
+        conn = self._connect()
+        added = []
+        with conn:
+            for user in users:
+                row = _user_row(user)
+                cur = conn.execute(
+                    "INSERT INTO users (username, username_lower, password, role, evaluator_access, name, vehicle_number) "
+                    "SELECT ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM users WHERE username_lower = ?)",
+                    row + (row[1],)
+                )
+                added.append(cur.rowcount == 1)
+            if any(added):
+                _bump_version(conn, "users_version")
+        return added
+
+    def append_reports(self, reports):
+        return self._insert_reports([{**report, REPORT_ID_COLUMN: None} for report in reports])
+
+    def _insert_reports(self, reports):
+        """Stores reports like `append_reports`, except that reports copied by a migration keep their IDs."""
+        conn = self._connect()
+        ids = []
+        reports = _normalize_times(reports)
+        with conn:
+            for report in reports:
+                # A NULL id lets SQLite give out the next one; migrated reports keep theirs
+                cur = conn.execute(
+                    f"INSERT INTO reports ({', '.join(REPORT_FIELDS)}) VALUES ({', '.join('?' * len(REPORT_FIELDS))})",
+                    _report_row(report)
+                )
+                ids.append(cur.lastrowid)
+            _apply_summary(conn, summarize_reports(_typed_times(pd.DataFrame(reports, columns=REPORTS_COLUMNS, dtype=str))))
+            _bump_version(conn, "reports_version")
+        return ids
+
+    def get_user(self, username):
+        cur = self._connect().execute(
+            f"SELECT {', '.join(USERS_COLUMNS)} FROM users WHERE username_lower = ? LIMIT 1",
+            (username.strip().lower(),)
+        )
+        row = cur.fetchone()
+        return dict(zip(USERS_COLUMNS, row)) if row else None
+
+    def users_version(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'users_version'").fetchone()
+        return row[0] if row else 0
+
+    def reports_version(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'reports_version'").fetchone()
+        return row[0] if row else 0
+
+    def list_users(self):
+        rows = self._connect().execute(f"SELECT {', '.join(USERS_COLUMNS)} FROM users ORDER BY rowid").fetchall()
+        return pd.DataFrame(rows, columns=USERS_COLUMNS, dtype=str)
+
+    def update_users(self, changes):
+        conn = self._connect()
+        with conn:
+            for username, fields in changes.items():
+                fields = {col: str(value) for col, value in fields.items() if col in USERS_COLUMNS[1:]}
+                if not fields:
+                    continue
+                conn.execute(
+                    f"UPDATE users SET {', '.join(f'{col} = ?' for col in fields)} WHERE username = ?",
+                    tuple(fields.values()) + (username,)
+                )
+            _bump_version(conn, "users_version")
+
+    def _load_live(self, username=None, before=None):
+        where, params = [], []
+        if username is not None:
+            where.append("username = ?")
+            params.append(username)
+        if before is not None:
+            where.append("started_at < ?")
+            params.append(before)
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+        rows = self._connect().execute(f"SELECT {', '.join(REPORT_FIELDS)} FROM reports{where_sql} ORDER BY id", params).fetchall()
+        return _typed_times(pd.DataFrame(rows, columns=REPORTS_COLUMNS, dtype=str))
+
+    def _stored_live_source_keys(self, keys):
+        conn = self._connect()
+        source_ids = sorted({source_id for _, source_id in keys})
+        found = set()
+        # Stays under SQLITE_MAX_VARIABLE_NUMBER of older SQLite versions
+        for start in range(0, len(source_ids), 999):
+            batch = source_ids[start:start + 999]
+            rows = conn.execute(f"SELECT username, source_id FROM reports WHERE source_id IN ({', '.join('?' * len(batch))})", batch)
+            found.update(keys.intersection(rows))
+        return found
+
+    def _query_live(self, query):
+        where, params = [], []
+        low, high = _date_bounds(query)
+        if low is not None:
+            where.append("started_at >= ?")
+            params.append(low)
+        if high is not None:
+            where.append("started_at < ?")
+            params.append(high)
+        if query.username:
+            where.append("username = ?")
+            params.append(query.username)
+        if query.vehicle_number:
+            where.append("vehicle_number = ?")
+            params.append(query.vehicle_number)
+        if query.name_contains:
+            where.append("report_name LIKE ? ESCAPE '\\'")
+            escaped = query.name_contains.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        if query.error:
+            where.append("instr('; ' || errors || '; ', ?) > 0")
+            params.append(f"; {query.error}; ")
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+
+        conn = self._connect()
+        total = conn.execute(f"SELECT COUNT(*) FROM reports{where_sql}", params).fetchone()[0]
+        sort_field = REPORT_FIELDS[REPORTS_COLUMNS.index(query.sort_by)]
+        direction = "DESC" if query.descending else "ASC"
+        rows = conn.execute(
+            f"SELECT {', '.join(REPORT_FIELDS)} FROM reports{where_sql} "
+            f"ORDER BY {sort_field} {direction}, id {direction} LIMIT ? OFFSET ?",
+            params + [query.limit, query.offset]
+        ).fetchall()
+        return _typed_times(pd.DataFrame(rows, columns=REPORTS_COLUMNS, dtype=str)), total
+
+    # Deleting by primary key is already an indexed O(log n) operation, so
+    # SQLite needs no tombstones; compaction just returns the freed pages.
+
+    def delete_reports(self, report_ids):
+        conn = self._connect()
+        ids = [int(i) for i in report_ids]
+        if not ids:
+            return
+        with conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(REPORT_FIELDS)} FROM reports WHERE id IN ({', '.join('?' * len(ids))})", ids
+            ).fetchall()
+            live = _typed_times(pd.DataFrame(rows, columns=REPORTS_COLUMNS, dtype=str))
+            # Reports that are not in the database may be in the archive
+            archived = self.archive.delete({str(i) for i in ids} - set(live[REPORT_ID_COLUMN]))
+            _apply_summary(conn, summarize_reports(pd.concat([live, archived], ignore_index=True)), sign=-1)
+            conn.executemany("DELETE FROM reports WHERE id = ?", [(i,) for i in ids])
+            _bump_version(conn, "reports_version")
+
+    def _remove_live(self, report_ids):
+        conn = self._connect()
+        with conn:
+            conn.executemany("DELETE FROM reports WHERE id = ?", [(int(i),) for i in report_ids])
+            _bump_version(conn, "reports_version")
+
+    def _oldest_live_start(self):
+        return self._connect().execute("SELECT MIN(started_at) FROM reports").fetchone()[0]
+
+    def load_summary(self):
+        rows = self._connect().execute(f"SELECT {', '.join(SUMMARY_FIELDS)} FROM report_summary").fetchall()
+        if not rows:
+            return empty_summary()
+        summary = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+        summary[LAST_ACTIVITY_COLUMN] = summary[LAST_ACTIVITY_COLUMN].astype("Int64")
+        return summary
+
+    def rebuild_summary(self):
+        conn = self._connect()
+        stored = self.load_summary()
+        rebuilt = summarize_reports(self.load_reports())
+        with conn:
+            conn.execute("DELETE FROM report_summary")
+            _apply_summary(conn, rebuilt)
+        return summaries_equal(stored, rebuilt)
+
+    def needs_compaction(self):
+        conn = self._connect()
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        total_pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        return free_pages > COMPACTION_TOMBSTONE_RATIO * max(total_pages, 1)
+
+    def compact(self):
+        self._connect().execute("VACUUM")
+
+
+# ------------------------------
+# Migration and Backend Selection
+# ------------------------------
+def migrate_csv_to_sqlite(backend, users_file=USERS_FILE, reports_file=REPORTS_FILE, reports_journal=REPORTS_JOURNAL):
+    """
+    Copies the users and reports from the CSV files into an SQLite backend.
+    Returns the number of users and reports copied.
+    """
+    source = CsvBackend(users_file, reports_file, reports_journal)
+    users = source.list_users().to_dict("records") if os.path.exists(users_file) else []
+    # The archive is shared by both backends, so only the live reports are copied
+    reports = source._load_live().to_dict("records")
+    backend.add_users(users)
+    backend._insert_reports(reports)
+    return len(users), len(reports)
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    """Returns the storage backend selected by name ("csv" or "sqlite")."""
+    if backend == "csv":
+        return CsvBackend()
+    if backend == "sqlite":
+        return SqliteBackend()
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+if __name__ == "__main__":
+    # Every command writes the store, so none may run while the app or an import does
+    try:
+        lock = StoreLock().acquire()
+    except StoreLockedError:
+        sys.exit("The store is in use by the app or an import; stop it and run the command again.")
+    if sys.argv[1:] == ["rebuild-summary"]:
+        storage = create_storage()
+        storage.ensure_ready()
+        if storage.rebuild_summary():
+            print("The summary table was consistent with the reports; it has been rebuilt.")
+        else:
+            print("The summary table did not match the reports; it has been rebuilt from them.")
+        sys.exit()
+    if sys.argv[1:] == ["archive"]:
+        storage = create_storage()
+        storage.ensure_ready()
+        moved = storage.archive_reports()
+        print(f"Moved {moved} reports into the archive in {ARCHIVE_DIR}.")
+        if storage.needs_compaction():
+            storage.compact()
+        sys.exit()
+    if sys.argv[1:] == ["compact"]:
+        storage = create_storage()
+        storage.ensure_ready()
+        storage.compact()
+        print(f"Compacted the {STORAGE_BACKEND} reports store.")
+        sys.exit()
+    if sys.argv[1:] != ["migrate"]:
+        sys.exit("usage: python storage.py migrate|compact|archive|rebuild-summary")
+    db = SqliteBackend()
+    db._ensure_schema(db._connect())
+    if db._connect().execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None:
+        sys.exit(f"{DATABASE_FILE} already contains users; nothing was migrated.")
+    n_users, n_reports = migrate_csv_to_sqlite(db)
+    print(f"Migrated {n_users} users and {n_reports} reports into {DATABASE_FILE}.")
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Lock that keeps a single process writing the store.
+
+The app applies every write through its one writer thread (see writer.py),
+and the CSV backend keeps its report counters and summary in the memory of
+that process, so no other process may write the store while the app runs.
+The app takes STORE_LOCK_FILE the first time it opens the store and holds it
+until it exits; the importer and the maintenance commands of storage.py take
+it before they write. Whoever comes second gets a StoreLockedError instead
+of writing under the other.
+
+The lock is an advisory lock on the file (flock, or msvcrt on Windows), so
+the operating system releases it when the process holding it exits, even
+after a crash.
+"""
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from config import STORE_LOCK_FILE
+
+
+class StoreLockedError(RuntimeError):
+    """Another process is writing the store."""
+
+
+class StoreLock:
+    """Exclusive, non-blocking lock on STORE_LOCK_FILE, held until `release()` or exit."""
+
+    def __init__(self, path=STORE_LOCK_FILE):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """Takes the lock without waiting. Raises StoreLockedError if another process holds it."""
+        if self._file is not None:
+            return self
+        f = open(self.path, "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            raise StoreLockedError(f"{self.path} is held by another process that is writing the store") from None
+        self._file = f
+        return self
+
+    def release(self):
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
@@ -2,59 +2,70 @@
 # Import necessary libraries
 import streamlit as st
 import pandas as pd
-import os
+from dataclasses import replace
 from datetime import datetime
-import pytz
-
-# ------------------------------
-# General Settings
-# ------------------------------
-REPORTS_FILE = "reports.csv"
-USERS_FILE = "users.csv"
-tz = pytz.timezone("Asia/Riyadh")
-
-# Define user roles for easy access
-ROLES = {
-    "admin": "admin",
-    "evaluator": "evaluator",
-    "viewer": "viewer"
-}
-
-# List of errors for the evaluation page, updated with new buttons
-ERRORS_LIST = [
-    "باب السائق", "حزام", "افضلية", "سرعة", "ضعف مراقبة",
-    "عدم التقيد بالمسارات", "سرعة اثناء الانعطاف", "إشارة للموازي",
-    "موقف موازي", "صدم بالموازي", "مراقبة اثناء الخروج", "استخدام كلتا القدمين",
-    "ضعف تحكم بالمقود", "صدم ثمانية", "إشارة ٩٠خلفي", "موقف ٩٠خلفي",
-    "صدم ٩٠خلفي", "عكس سير", "فلشر للرجوع", "الرجوع للخلف",
-    "مراقبة اثناء الرجوع", "تسارع عالي", "تباطؤ", "فرامل", "علامةقف",
-    "صدم رصيف", "خطوط المشاة", "تجاوز اشارة", "موقف نهائي", "صدم نهائي",
-    "التموضع بالموازي", "تموضع ٩٠خلفي"
-]
+from config import (
+    ROLES, COMMIT_TIMEOUT, ERROR_EVENTS_COLUMN, ERRORS_LIST, ERRORS_MASK_COLUMN, PDF_EXPORT_MAX_REPORTS, REPORT_ID_COLUMN,
+    REPORTS_COLUMNS, REPORTS_PAGE_SIZE, SOURCE_ID_COLUMN, USERS_PAGE_SIZE, tz
+)
+from storage import ReportQuery, create_storage
+from error_codes import ERROR_CODES, ERROR_NAMES, encode_errors, encode_events
+from analytics import (
+    cooccurrence_matrix, error_frequency, error_rates_by, error_timing, evaluation_durations,
+    evaluations_over_time, throughput, vehicle_utilisation
+)
+from timestamps import now_epoch, with_local_times
+from summaries import LAST_ACTIVITY_COLUMN, REPORTS_COUNT_COLUMN, totals_by
+from drafts import discard_draft, load_draft, record_event, record_notes, record_undo, start_draft
+from pdf_export import PdfExportError, export_reports_zip
+from profiling import ProfiledStorage, Profiler
+from report_cache import ReportPageCache
+from store_lock import StoreLock, StoreLockedError
+from user_index import UserIndex
+from writer import CommitQueue
 
 # ------------------------------
 # Ensure files exist and handle user setup
 # ------------------------------
+@st.cache_resource
+def get_profiler():
+    """Returns the profiler collecting timings from all sessions of this process."""
+    return Profiler()
+
+@st.cache_resource
+def get_store_lock():
+    """Returns the lock that keeps the importer and other processes from writing the store while the app runs."""
+    return StoreLock().acquire()
+
+@st.cache_resource
+def get_storage():
+    """Returns the storage backend shared by all sessions of this process, with its calls timed."""
+    get_store_lock()
+    profiler = get_profiler()
+    storage = create_storage()
+    return ProfiledStorage(storage, profiler) if profiler.enabled else storage
+
+@st.cache_resource
+def get_user_index():
+    """Returns the in-memory user index shared by all sessions of this process."""
+    return UserIndex(get_storage())
+
+@st.cache_resource
+def get_report_cache():
+    """Returns the cache of prepared report pages shared by all sessions of this process."""
+    return ReportPageCache()
+
+@st.cache_resource
+def get_commit_queue():
+    """Returns the writer thread that applies every write of this process in batches."""
+    return CommitQueue(get_storage())
+
 def ensure_files_exist():
     """
-    Creates the necessary CSV files if they don't exist.
-    Initializes a new admin and viewer user if the users file is missing.
+    Creates the necessary files or tables if they don't exist.
+    Initializes a new admin and viewer user if there are no users yet.
     """
-    # Define columns for the reports file
-    reports_cols = ["اسم التقرير", "وقت البداية", "وقت النهاية", "الأخطاء", "ملاحظات", "اسم المستخدم", "رقم المركبة"]
-    if not os.path.exists(REPORTS_FILE):
-        df = pd.DataFrame(columns=reports_cols)
-        df.to_csv(REPORTS_FILE, index=False)
-        
-    # Define columns for the users file, including name and vehicle number
-    users_cols = ["username", "password", "role", "evaluator_access", "name", "vehicle_number"]
-    if not os.path.exists(USERS_FILE):
-        initial_users = [
-            {"username": "hus585", "password": "268450", "role": ROLES["admin"], "evaluator_access": True, "name": "المستخدم الرئيسي", "vehicle_number": "12345"},
-            {"username": "qwe", "password": "123123", "role": ROLES["viewer"], "evaluator_access": False, "name": "المشاهد", "vehicle_number": "98765"}
-        ]
-        df = pd.DataFrame(initial_users)
-        df.to_csv(USERS_FILE, index=False)
+    get_storage().ensure_ready()
 
 # ------------------------------
 # User Management Functions
@@ -62,21 +73,14 @@ def ensure_files_exist():
 def login(username, password):
     """Authenticates the user and returns their details."""
     try:
-        df = pd.read_csv(USERS_FILE, dtype=str)
-        df['username'] = df['username'].str.strip()
-        df['password'] = df['password'].str.strip()
-        
-        # Convert both the input username and the dataframe usernames to lowercase for case-insensitive comparison
-        input_username_lower = username.lower()
-        df['username_lower'] = df['username'].str.lower()
-        
-        user = df[(df["username_lower"] == input_username_lower) & (df["password"] == password)]
+        # Usernames are compared case-insensitively
+        user = get_user_index().get(username)
         
-        if not user.empty:
-            role = user.iloc[0]["role"]
-            evaluator_access = user.iloc[0]["evaluator_access"] == "True"
-            name = user.iloc[0]["name"]
-            vehicle_number = user.iloc[0]["vehicle_number"]
+        if user is not None and user["password"] == password:
+            role = user["role"]
+            evaluator_access = user["evaluator_access"] == "True"
+            name = user["name"]
+            vehicle_number = user["vehicle_number"]
             return role, evaluator_access, name, vehicle_number
         return None, False, None, None
     except Exception as e:
@@ -88,84 +92,220 @@ def register_user(username, password, name, vehicle_number):
     Registers a new user with an 'evaluator' role and no access initially.
     """
     try:
-        df = pd.read_csv(USERS_FILE, dtype=str)
-        if username in df["username"].values:
+        # Logins ignore letter case, so "Ali" and "ali" would be the same account
+        if username in get_user_index():
             return False, "اسم المستخدم موجود بالفعل."
-        
-        new_row = pd.DataFrame([{
+        added = get_commit_queue().add_user({
             "username": username,
             "password": password,
             "role": ROLES["evaluator"],
-            "evaluator_access": False,
+            "evaluator_access": str(False),
             "name": name,
             "vehicle_number": vehicle_number
-        }])
-        df = pd.concat([df, new_row], ignore_index=True)
-        df.to_csv(USERS_FILE, index=False)
+        }).result(timeout=COMMIT_TIMEOUT)
+        if not added:
+            return False, "اسم المستخدم موجود بالفعل."
         return True, "تم التسجيل بنجاح. سيتم تفعيل حسابك لاحقًا من قِبل المسؤول."
     except Exception as e:
         return False, f"حدث خطأ أثناء التسجيل: {e}"
 
-def update_user_permissions(username, new_role, new_access, new_name, new_password):
+# Labels of the user fields that cannot be left empty in the admin panel
+REQUIRED_USER_FIELDS = {"password": "كلمة المرور", "role": "الدور"}
+
+def update_users_bulk(edits):
     """
-    Updates a user's details and permissions from the admin panel.
+    Applies the admin panel edits ({username: {column: value}}) in one write.
+    Only the users and fields that actually changed are written.
+    Returns (success, message, changes) where `changes` maps every modified
+    username to {column: (old value, new value)}.
     """
     try:
-        df = pd.read_csv(USERS_FILE, dtype=str)
-        df.loc[df['username'] == username, 'role'] = new_role
-        df.loc[df['username'] == username, 'evaluator_access'] = str(new_access)
-        df.loc[df['username'] == username, 'name'] = new_name
-        df.loc[df['username'] == username, 'password'] = new_password
-        df.to_csv(USERS_FILE, index=False)
-        return True, "تم حفظ التعديلات بنجاح."
+        changes = {}
+        for username, fields in edits.items():
+            # A cleared cell comes back as None (or NaN) and is stored as an empty string
+            fields = {col: "" if value is None or pd.isna(value) else str(value) for col, value in fields.items()}
+            empty = [label for col, label in REQUIRED_USER_FIELDS.items() if fields.get(col) == ""]
+            if empty:
+                return False, f"الحقول التالية مطلوبة للمستخدم {username}: {'، '.join(empty)}. لم يتم حفظ أي تعديل.", {}
+            # Only the edited users are looked up, in the in-memory index
+            user = get_user_index().get(username)
+            if user is None or user["username"] != username:
+                continue
+            diff = {
+                col: (user[col], value)
+                for col, value in fields.items()
+                if user[col] != value
+            }
+            if diff:
+                changes[username] = diff
+        
+        if not changes:
+            return True, "لا توجد تعديلات لحفظها.", changes
+        get_commit_queue().update_users({
+            username: {col: new for col, (old, new) in diff.items()}
+            for username, diff in changes.items()
+        }).result(timeout=COMMIT_TIMEOUT)
+        return True, f"تم حفظ التعديلات لعدد {len(changes)} من المستخدمين.", changes
     except Exception as e:
-        return False, f"حدث خطأ أثناء حفظ التعديلات: {e}"
+        return False, f"حدث خطأ أثناء حفظ التعديلات: {e}", {}
+
+def filter_users(df_users, search="", role=None, access=None):
+    """
+    Returns the users whose username or name contains `search` (ignoring
+    letter case) and, when given, that have this role and evaluator access.
+    """
+    mask = pd.Series(True, index=df_users.index)
+    if search:
+        mask &= (df_users["username"].str.contains(search, case=False, regex=False)
+                 | df_users["name"].str.contains(search, case=False, regex=False))
+    if role is not None:
+        mask &= df_users["role"] == role
+    if access is not None:
+        mask &= df_users["evaluator_access"] == str(access)
+    return df_users[mask]
 
 def update_my_account(username, new_password, new_name, new_vehicle_number):
     """Updates the current user's own account details."""
     try:
-        df = pd.read_csv(USERS_FILE, dtype=str)
-        df.loc[df['username'] == username, 'password'] = new_password
-        df.loc[df['username'] == username, 'name'] = new_name
-        df.loc[df['username'] == username, 'vehicle_number'] = new_vehicle_number
-        df.to_csv(USERS_FILE, index=False)
+        get_commit_queue().update_users({username: {
+            "password": new_password,
+            "name": new_name,
+            "vehicle_number": new_vehicle_number
+        }}).result(timeout=COMMIT_TIMEOUT)
         return True, "تم تحديث معلومات حسابك بنجاح."
     except Exception as e:
         return False, f"حدث خطأ أثناء تحديث الحساب: {e}"
 
-def save_report(report_name, start_time, end_time, errors, notes, username, vehicle_number):
-    """Saves a new report to the CSV file, including the user's name and vehicle number."""
+def save_report(report_name, start_time, end_time, errors, notes, username, vehicle_number, error_events=()):
+    """
+    Saves a new report, including the user's name and vehicle number and
+    when each error was recorded. Returns the ID given to the report, or
+    None if it could not be saved.
+    """
     try:
-        df = pd.read_csv(REPORTS_FILE)
-        new_row = pd.DataFrame([{
+        return get_commit_queue().append_report({
             "اسم التقرير": report_name,
             "وقت البداية": start_time,
             "وقت النهاية": end_time,
             "الأخطاء": "; ".join(errors),
             "ملاحظات": notes,
             "اسم المستخدم": username,
-            "رقم المركبة": vehicle_number
-        }])
-        df = pd.concat([df, new_row], ignore_index=True)
-        df.to_csv(REPORTS_FILE, index=False)
+            "رقم المركبة": vehicle_number,
+            ERRORS_MASK_COLUMN: str(encode_errors(errors)),
+            ERROR_EVENTS_COLUMN: encode_events(error_events)
+        }).result(timeout=COMMIT_TIMEOUT)
     except Exception as e:
         st.error(f"حدث خطأ أثناء حفظ التقرير: {e}")
+        return None
 
-def delete_report(report_name):
-    """Deletes a report by name from the CSV file."""
+def delete_report(report_id):
+    """Deletes a report by its ID."""
     try:
-        df = pd.read_csv(REPORTS_FILE)
-        df = df[df["اسم التقرير"] != report_name]
-        df.to_csv(REPORTS_FILE, index=False)
+        get_commit_queue().delete_report(report_id).result(timeout=COMMIT_TIMEOUT)
     except Exception as e:
         st.error(f"حدث خطأ أثناء حذف التقرير: {e}")
 
+def load_reports_page(query):
+    """
+    Returns the page of reports matching `query`, with local times, as a
+    CachedPage (see report_cache.py). It is reused until the reports change.
+    """
+    # Evaluators only ever see their own reports, so their pages are cached apart
+    scope = query.username if st.session_state.role == ROLES["evaluator"] else "*"
+    def load():
+        df, total = get_storage().query_reports(query)
+        # Times are stored in UTC and shown in local time
+        return with_local_times(df), total
+    return get_report_cache().get(get_storage().reports_version(), scope, query, load)
+
+def show_dataframe(data, **kwargs):
+    """Displays a table and counts its rows as sent to the browser in this rerun."""
+    get_profiler().add_rows(len(data))
+    st.dataframe(data, **kwargs)
+
+# ------------------------------
+# Evaluation Errors Panel
+# ------------------------------
+def restore_draft(username):
+    """
+    Continues the user's unfinished evaluation, if there is one on disk.
+    Returns True if a draft was restored.
+    """
+    try:
+        draft = load_draft(username)
+    except Exception as e:
+        st.error(f"حدث خطأ أثناء قراءة التقييم غير المكتمل: {e}")
+        return False
+    if draft is None:
+        return False
+    st.session_state.draft = draft
+    st.session_state.report_name = draft["report_name"]
+    st.session_state.start_time = draft["start_time"]
+    st.session_state.errors = [ERROR_NAMES[code] for code, offset in draft["events"]]
+    st.session_state.notes = draft["notes"]
+    st.session_state.page = "errors"
+    return True
+
+def record_error(err):
+    """
+    Button callback: records an error once, however many times its button is
+    tapped, and appends it with its time to the evaluation's draft.
+    """
+    if err in st.session_state.errors:
+        return
+    st.session_state.errors.append(err)
+    try:
+        record_event(st.session_state.username, st.session_state.draft, ERROR_CODES[err])
+    except Exception as e:
+        st.error(f"حدث خطأ أثناء حفظ الخطأ في المسودة: {e}")
+
+def undo_last_error(recorded_count):
+    """
+    Button callback: removes the last recorded error. `recorded_count` is the
+    number of errors shown when the button was drawn; a repeated tap that
+    arrives after the list has already shrunk is ignored.
+    """
+    if st.session_state.errors and len(st.session_state.errors) == recorded_count:
+        st.session_state.errors.pop()
+        try:
+            record_undo(st.session_state.username, st.session_state.draft)
+        except Exception as e:
+            st.error(f"حدث خطأ أثناء حفظ الخطأ في المسودة: {e}")
+
+@st.fragment
+def errors_panel():
+    """
+    The recorded errors and the error buttons. Tapping a button reruns only
+    this fragment, not the whole page.
+    """
+    with get_profiler().fragment("errors", "errors_panel"):
+        # Display the recorded errors
+        if st.session_state.errors:
+            st.write("الأخطاء المسجلة:")
+            for i, err in enumerate(st.session_state.errors):
+                st.info(f"{i + 1}. {err}")
+            
+            # Button to undo the last error
+            st.button("إلغاء آخر خطأ", on_click=undo_last_error, args=(len(st.session_state.errors),))
+
+        cols = st.columns(3)
+        for i, err in enumerate(ERRORS_LIST):
+            button_disabled = err in st.session_state.errors
+            with cols[i % 3]:
+                st.button(err, disabled=button_disabled, key=f"err_btn_{i}", on_click=record_error, args=(err,))
+
 # ------------------------------
 # Application Interface
 # ------------------------------
 def main():
     st.set_page_config(page_title="تقييم", layout="centered")
-    ensure_files_exist()
+    try:
+        with get_profiler().measure("ensure_files_exist"):
+            ensure_files_exist()
+    except StoreLockedError:
+        # An import is running; the lock is tried again on the next rerun
+        st.error("يجري حالياً استيراد البيانات. يرجى المحاولة بعد قليل.")
+        st.stop()
 
     # Session State management
     if "page" not in st.session_state: st.session_state.page = "login"
@@ -178,6 +318,7 @@ def main():
     if "report_name" not in st.session_state: st.session_state.report_name = ""
     if "start_time" not in st.session_state: st.session_state.start_time = None
     if "notes" not in st.session_state: st.session_state.notes = ""
+    if "draft" not in st.session_state: st.session_state.draft = None
 
     # -------------------- Login Page --------------------
     if st.session_state.page == "login":
@@ -196,6 +337,8 @@ def main():
                     st.session_state.evaluator_name = name
                     st.session_state.vehicle_number = vehicle
                     st.session_state.page = "home"
+                    # An evaluation interrupted by a lost connection continues where it stopped
+                    restore_draft(username)
                     st.success("تم تسجيل الدخول بنجاح")
                     st.rerun()
                 else:
@@ -233,48 +376,88 @@ def main():
     elif st.session_state.page == "admin_management":
         st.title("👨‍💼 إدارة المستخدمين")
         
-        df_users = pd.read_csv(USERS_FILE, dtype=str)
         st.write("يمكنك تعديل معلومات وصلاحيات المستخدمين من هنا:")
         
-        form_submitted = False
-        with st.form("admin_form"):
-            for index, row in df_users.iterrows():
-                username = row['username']
-                st.markdown(f"### المستخدم: {username}")
-                
-                new_name = st.text_input(f"اسم المقيم", value=row['name'], key=f"name_{username}")
-                new_password = st.text_input(f"كلمة المرور", value=row['password'], type="password", key=f"password_{username}")
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    new_role = st.selectbox(
-                        "الدور",
-                        options=list(ROLES.values()),
-                        index=list(ROLES.values()).index(row['role']),
-                        key=f"role_{username}"
-                    )
-                with col2:
-                    new_access = st.checkbox(
-                        "صلاحية التقييم",
-                        value=(row['evaluator_access'] == "True"),
-                        key=f"access_{username}"
-                    )
-                st.markdown("---")
-            
-            if st.form_submit_button("حفظ التعديلات"):
-                form_submitted = True
+        # Result of the last save, kept across the rerun that follows it
+        saved = st.session_state.pop("users_saved", None)
+        if saved is not None:
+            message, changes = saved
+            st.success(message)
+            # Summarize what changed per user, without revealing passwords
+            for username, diff in changes.items():
+                fields = ", ".join("password" if col == "password" else f"{col}: {old} ← {new}" for col, (old, new) in diff.items())
+                st.write(f"- **{username}**: {fields}")
         
-        if form_submitted:
-            for index, row in df_users.iterrows():
-                username = row['username']
-                new_name = st.session_state[f"name_{username}"]
-                new_password = st.session_state[f"password_{username}"]
-                new_role = st.session_state[f"role_{username}"]
-                new_access = st.session_state[f"access_{username}"]
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            search = st.text_input("بحث باسم المستخدم أو الاسم", key="users_search").strip()
+        with col2:
+            role_filter = st.selectbox("الدور", ["الكل"] + list(ROLES.values()), key="users_role")
+        with col3:
+            access_filter = st.selectbox("صلاحية التقييم", ["الكل", "مفعلة", "غير مفعلة"], key="users_access")
+        
+        df_users = filter_users(
+            get_user_index().frame(),
+            search,
+            role=None if role_filter == "الكل" else role_filter,
+            access=None if access_filter == "الكل" else access_filter == "مفعلة"
+        )
+        if df_users.empty:
+            st.info("لا يوجد مستخدمون مطابقون.")
+        else:
+            page_count = (len(df_users) + USERS_PAGE_SIZE - 1) // USERS_PAGE_SIZE
+            page_number = min(st.number_input("الصفحة", min_value=1, step=1, key="users_page_number"), page_count)
+            st.caption(f"عدد المستخدمين المطابقين: {len(df_users)} — الصفحة {page_number} من {page_count}")
+            # Only the visible page is sent to the editor, so its size does not grow with the users
+            page = df_users.iloc[(page_number - 1) * USERS_PAGE_SIZE:page_number * USERS_PAGE_SIZE]
+            rows = pd.DataFrame({
+                "username": page["username"],
+                "name": page["name"],
+                # Passwords are not shown; a value typed here replaces the user's password
+                "password": "",
+                "role": page["role"],
+                "evaluator_access": page["evaluator_access"] == "True",
+                "vehicle_number": page["vehicle_number"]
+            }).reset_index(drop=True)
+            
+            # A new key after every save or page change starts the editor without pending edits
+            editor_key = f"users_editor_{st.session_state.get('users_editor_version', 0)}_{search}_{role_filter}_{access_filter}_{page_number}"
+            with st.form("admin_form"):
+                st.data_editor(
+                    rows,
+                    key=editor_key,
+                    hide_index=True,
+                    num_rows="fixed",
+                    disabled=["username", "vehicle_number"],
+                    column_config={
+                        "username": st.column_config.TextColumn("اسم المستخدم"),
+                        "name": st.column_config.TextColumn("اسم المقيم"),
+                        "password": st.column_config.TextColumn("كلمة مرور جديدة"),
+                        "role": st.column_config.SelectboxColumn("الدور", options=list(ROLES.values()), required=True),
+                        "evaluator_access": st.column_config.CheckboxColumn("صلاحية التقييم"),
+                        "vehicle_number": st.column_config.TextColumn("رقم المركبة")
+                    }
+                )
+                form_submitted = st.form_submit_button("حفظ التعديلات")
+            
+            if form_submitted:
+                # Only the rows touched in the editor are submitted, with only their edited cells
+                edits = {}
+                for position, fields in st.session_state[editor_key]["edited_rows"].items():
+                    fields = {col: value for col, value in fields.items() if not (col == "password" and not value)}
+                    if "evaluator_access" in fields:
+                        fields["evaluator_access"] = str(bool(fields["evaluator_access"]))
+                    if fields:
+                        edits[rows.at[int(position), "username"]] = fields
                 
-                update_user_permissions(username, new_role, new_access, new_name, new_password)
-            st.success("تم تحديث جميع الصلاحيات بنجاح.")
-            st.rerun()
+                success, message, changes = update_users_bulk(edits)
+                if success:
+                    st.session_state.users_editor_version = st.session_state.get("users_editor_version", 0) + 1
+                    st.session_state.users_saved = (message, changes)
+                    # Rerun so the filters and the editor show the saved values
+                    st.rerun()
+                else:
+                    st.error(message)
             
         if st.button("🔙 رجوع إلى الرئيسية"):
             st.session_state.page = "home"
@@ -323,11 +506,15 @@ def main():
                 if not st.session_state.report_name.strip():
                     st.error("أدخل اسم التقرير أولاً")
                 else:
-                    st.session_state.start_time = datetime.now(tz).strftime("%Y-%m-%d %H:%M")
+                    st.session_state.start_time = now_epoch()
                     st.session_state.errors = []
                     st.session_state.notes = ""
-                    st.session_state.page = "errors"
-                    st.rerun()
+                    try:
+                        st.session_state.draft = start_draft(st.session_state.username, st.session_state.report_name, st.session_state.start_time, st.session_state.vehicle_number)
+                        st.session_state.page = "errors"
+                        st.rerun()
+                    except OSError as e:
+                        st.error(f"حدث خطأ أثناء إنشاء مسودة التقييم: {e}")
         else:
             st.info("ليس لديك صلاحية لإجراء تقييمات.")
 
@@ -347,6 +534,18 @@ def main():
                 if st.button("👨‍💼 إدارة المستخدمين"):
                     st.session_state.page = "admin_management"
                     st.rerun()
+                if st.button("🗂️ لوحة الملخص"):
+                    st.session_state.page = "summary"
+                    st.rerun()
+                if st.button("📈 إحصائيات الأخطاء"):
+                    st.session_state.page = "analytics"
+                    st.rerun()
+                if st.button("🚗 مدة التقييمات والاستخدام"):
+                    st.session_state.page = "usage"
+                    st.rerun()
+                if st.button("⏱️ أداء التطبيق"):
+                    st.session_state.page = "profiling"
+                    st.rerun()
 
         st.markdown("---")
         if st.button("🚪 خروج"):
@@ -363,17 +562,6 @@ def main():
         st.title("🚦 الأخطاء")
         st.write("اختر الأخطاء التي وقع فيها السائق:")
         
-        # Display the recorded errors
-        if st.session_state.errors:
-            st.write("الأخطاء المسجلة:")
-            for i, err in enumerate(st.session_state.errors):
-                st.info(f"{i + 1}. {err}")
-            
-            # Button to undo the last error
-            if st.button("إلغاء آخر خطأ"):
-                st.session_state.errors.pop()
-                st.rerun()
-
         # Inject CSS to make buttons fill the column
         st.markdown("""
         <style>
@@ -383,53 +571,128 @@ def main():
         </style>
         """, unsafe_allow_html=True)
 
-        cols = st.columns(3)
-        for i, err in enumerate(ERRORS_LIST):
-            button_disabled = err in st.session_state.errors
-            with cols[i % 3]:
-                if st.button(err, disabled=button_disabled, key=f"err_btn_{i}"):
-                    st.session_state.errors.append(err)
-                    st.success(f"تم تسجيل: {err}")
-                    st.rerun()
+        errors_panel()
         
-        st.session_state.notes = st.text_area("ملاحظات إضافية", st.session_state.notes)
+        notes = st.text_area("ملاحظات إضافية", st.session_state.notes)
+        if notes != st.session_state.notes:
+            st.session_state.notes = notes
+            try:
+                record_notes(st.session_state.username, st.session_state.draft, notes)
+            except Exception as e:
+                st.error(f"حدث خطأ أثناء حفظ الملاحظات في المسودة: {e}")
         
         st.markdown("---")
         col1, col2 = st.columns(2)
         with col1:
             if st.button("إنهاء التقييم"):
-                end_time = datetime.now(tz).strftime("%Y-%m-%d %H:%M")
-                save_report(st.session_state.report_name, st.session_state.start_time, end_time, st.session_state.errors, st.session_state.notes, st.session_state.username, st.session_state.vehicle_number)
-                st.success("✅ تم حفظ التقرير")
-                st.session_state.page = "home"
-                st.rerun()
+                end_time = now_epoch()
+                report_id = save_report(st.session_state.report_name, st.session_state.start_time, end_time, st.session_state.errors, st.session_state.notes, st.session_state.username, st.session_state.vehicle_number, (st.session_state.draft or {}).get("events", ()))
+                # On failure the draft is kept, so the evaluation can still be saved
+                if report_id is not None:
+                    discard_draft(st.session_state.username)
+                    st.session_state.draft = None
+                    st.success("✅ تم حفظ التقرير")
+                    st.session_state.page = "home"
+                    st.rerun()
 
         with col2:
             if st.button("إلغاء التقييم"):
+                discard_draft(st.session_state.username)
+                st.session_state.draft = None
                 st.session_state.page = "home"
                 st.rerun()
 
     # -------------------- Reports Page --------------------
     elif st.session_state.page == "reports":
         st.title("📑 السجلات")
+        is_admin = st.session_state.role == ROLES["admin"]
+        
+        # Filters are applied by the storage backend, so only one page of reports is loaded
+        with st.expander("🔎 البحث والتصفية", expanded=False):
+            col1, col2 = st.columns(2)
+            with col1:
+                start_date = st.date_input("من تاريخ", value=None, key="reports_start_date")
+                vehicle_number = st.text_input("رقم المركبة", key="reports_vehicle").strip()
+                error = st.selectbox("نوع الخطأ", ["الكل"] + ERRORS_LIST, key="reports_error")
+            with col2:
+                end_date = st.date_input("إلى تاريخ", value=None, key="reports_end_date")
+                name_contains = st.text_input("اسم التقرير يحتوي على", key="reports_name").strip()
+                evaluator = ""
+                if st.session_state.role != ROLES["evaluator"]:
+                    evaluator = st.text_input("اسم المستخدم (المقيم)", key="reports_evaluator").strip()
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                sort_columns = [col for col in REPORTS_COLUMNS if col not in (REPORT_ID_COLUMN, ERRORS_MASK_COLUMN, ERROR_EVENTS_COLUMN, SOURCE_ID_COLUMN)]
+                sort_by = st.selectbox("ترتيب حسب", sort_columns, index=sort_columns.index("وقت البداية"), key="reports_sort_by")
+            with col2:
+                descending = st.selectbox("الاتجاه", ["تنازلي", "تصاعدي"], key="reports_direction") == "تنازلي"
+            with col3:
+                page_size = st.selectbox("عدد التقارير في الصفحة", [25, REPORTS_PAGE_SIZE, 100, 200], index=1, key="reports_page_size")
+        
+        query = ReportQuery(
+            start_date=start_date,
+            end_date=end_date,
+            username=evaluator or None,
+            vehicle_number=vehicle_number or None,
+            name_contains=name_contains or None,
+            error=None if error == "الكل" else error,
+            sort_by=sort_by,
+            descending=descending,
+            limit=page_size
+        )
+        
+        # Filter reports based on user role
+        if st.session_state.role == ROLES["evaluator"]:
+            query.username = st.session_state.username
+            st.info("أنت تشاهد تقاريرك الخاصة فقط.")
+        
         try:
-            df = pd.read_csv(REPORTS_FILE)
+            page_number = st.number_input("الصفحة", min_value=1, step=1, key="reports_page_number")
+            query.offset = (page_number - 1) * page_size
+            page = load_reports_page(query)
+            df, total = page.frame, page.total
             
-            # Filter reports based on user role
-            if st.session_state.role == ROLES["evaluator"]:
-                df = df[df["اسم المستخدم"] == st.session_state.username]
-                st.info("أنت تشاهد تقاريرك الخاصة فقط.")
-            
-            if not df.empty:
-                st.dataframe(df)
+            if total:
+                page_count = (total + page_size - 1) // page_size
+                if page_number > page_count:
+                    # The filters were narrowed; show the last page that still has results
+                    page_number = page_count
+                    query.offset = (page_number - 1) * page_size
+                    page = load_reports_page(query)
+                    df, total = page.frame, page.total
+                st.caption(f"عدد التقارير المطابقة: {total} — الصفحة {page_number} من {page_count}")
+                # The error mask is for analytics and the source ID for the importer; the text columns are what people read
+                show_dataframe(page.table, column_config={ERRORS_MASK_COLUMN: None, ERROR_EVENTS_COLUMN: None, SOURCE_ID_COLUMN: None})
+                
+                # Every report matching the filters, not only this page, is exported
+                if st.button("📄 تصدير التقارير المطابقة PDF"):
+                    try:
+                        df_export, _ = get_storage().query_reports(replace(query, offset=0, limit=PDF_EXPORT_MAX_REPORTS))
+                        with st.spinner("جاري تجهيز ملفات PDF..."):
+                            zip_bytes, exported = export_reports_zip(with_local_times(df_export).to_dict("records"))
+                        # Capped by PDF_EXPORT_MAX_REPORTS, and by PDF_EXPORT_MAX_BYTES since the ZIP is held in memory
+                        if exported < total:
+                            st.warning(f"تم تصدير أول {exported} تقرير فقط من {total}. استخدم التصفية لتقليل العدد.")
+                        st.download_button("⬇️ تحميل ملف التقارير (ZIP)", zip_bytes, file_name="reports.zip", mime="application/zip")
+                    except PdfExportError as e:
+                        st.error(f"تعذر تصدير التقارير: {e}")
                 
                 # Admin can delete reports
-                if st.session_state.role == ROLES["admin"]:
-                    report_name_to_delete = st.selectbox("اختر تقرير لحذفه", df["اسم التقرير"].unique())
+                if is_admin:
+                    labels = dict(zip(df[REPORT_ID_COLUMN], df[REPORT_ID_COLUMN] + " — " + df["اسم التقرير"].fillna("") + " — " + df["وقت البداية"].fillna("")))
+                    report_id_to_delete = st.selectbox("اختر تقرير لحذفه", list(labels), format_func=labels.get)
                     if st.button("🗑️ حذف التقرير"):
-                        delete_report(report_name_to_delete)
+                        delete_report(report_id_to_delete)
                         st.success("تم حذف التقرير")
                         st.rerun()
+                    if st.button("🧹 ضغط ملف التقارير"):
+                        # Runs on the writer thread; the page does not wait for it
+                        get_commit_queue().compact()
+                        st.info("ستتم إزالة التقارير المحذوفة من الملف في الخلفية.")
+                    if st.button("📦 أرشفة الأشهر المغلقة"):
+                        # Runs on the writer thread; archived reports stay visible here
+                        get_commit_queue().archive()
+                        st.info("سيتم نقل تقارير الأشهر المغلقة إلى الأرشيف في الخلفية.")
                 else:
                     st.warning("ليس لديك صلاحية لحذف التقارير.")
 
@@ -444,8 +707,149 @@ def main():
             st.session_state.page = "home"
             st.rerun()
 
+    # -------------------- Summary Dashboard Page --------------------
+    elif st.session_state.page == "summary":
+        st.title("🗂️ لوحة الملخص")
+        if st.session_state.role != ROLES["admin"]:
+            st.warning("هذه الصفحة متاحة للمسؤول فقط.")
+        else:
+            try:
+                # Read from the summary table, not the reports, so the cost does not grow with the history
+                summary = get_storage().load_summary()
+                if summary.empty:
+                    st.info("لا توجد تقارير متاحة.")
+                else:
+                    by_evaluator = totals_by(summary, "اسم المستخدم")
+                    by_vehicle = totals_by(summary, "رقم المركبة")
+                    by_day = totals_by(summary, "اليوم").sort_index()
+                    
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("عدد التقارير", int(summary[REPORTS_COUNT_COLUMN].sum()))
+                    col2.metric("عدد المقيمين", len(by_evaluator))
+                    col3.metric("عدد المركبات", len(by_vehicle))
+                    
+                    st.subheader("التقارير اليومية")
+                    st.line_chart(by_day[REPORTS_COUNT_COLUMN].tail(90))
+                    
+                    st.subheader("الأخطاء الأكثر تكرارًا")
+                    st.bar_chart(by_evaluator[ERRORS_LIST].sum().sort_values(ascending=False))
+                    
+                    st.subheader("حسب المقيم")
+                    show_dataframe(with_local_times(by_evaluator, [LAST_ACTIVITY_COLUMN]))
+                    
+                    st.subheader("حسب المركبة")
+                    show_dataframe(with_local_times(by_vehicle, [LAST_ACTIVITY_COLUMN]))
+            except Exception as e:
+                st.error(f"حدث خطأ أثناء قراءة الملخص: {e}")
+        
+        if st.button("🔙 رجوع"):
+            st.session_state.page = "home"
+            st.rerun()
+
+    # -------------------- Error Analytics Page --------------------
+    elif st.session_state.page == "analytics":
+        st.title("📈 إحصائيات الأخطاء")
+        if st.session_state.role != ROLES["admin"]:
+            st.warning("هذه الصفحة متاحة للمسؤول فقط.")
+        else:
+            try:
+                df = get_storage().load_reports()
+                if df.empty:
+                    st.info("لا توجد تقارير متاحة.")
+                else:
+                    st.write(f"عدد التقارير: {len(df)}")
+                    
+                    st.subheader("تكرار الأخطاء")
+                    st.bar_chart(error_frequency(df))
+                    
+                    st.subheader("نسبة الأخطاء لكل مقيم")
+                    show_dataframe(error_rates_by(df, "اسم المستخدم"))
+                    
+                    st.subheader("نسبة الأخطاء لكل مركبة")
+                    show_dataframe(error_rates_by(df, "رقم المركبة"))
+                    
+                    st.subheader("الأخطاء التي تحدث معًا")
+                    show_dataframe(cooccurrence_matrix(df))
+                    
+                    st.subheader("توقيت الأخطاء خلال التقييم")
+                    show_dataframe(error_timing(df))
+            except Exception as e:
+                st.error(f"حدث خطأ أثناء حساب الإحصائيات: {e}")
+        
+        if st.button("🔙 رجوع"):
+            st.session_state.page = "home"
+            st.rerun()
+
+    # -------------------- Durations and Utilisation Page --------------------
+    elif st.session_state.page == "usage":
+        st.title("🚗 مدة التقييمات والاستخدام")
+        if st.session_state.role != ROLES["admin"]:
+            st.warning("هذه الصفحة متاحة للمسؤول فقط.")
+        else:
+            try:
+                df = get_storage().load_reports()
+                if df.empty:
+                    st.info("لا توجد تقارير متاحة.")
+                else:
+                    freq = {"يوم": "D", "ساعة": "h"}[st.radio("الفترة", ["يوم", "ساعة"], horizontal=True, key="usage_period")]
+                    
+                    st.subheader("عدد التقييمات عبر الزمن")
+                    st.line_chart(evaluations_over_time(df, freq))
+                    
+                    st.subheader("مدة التقييم لكل مقيم")
+                    show_dataframe(evaluation_durations(df))
+                    
+                    st.subheader("إنتاجية كل مقيم")
+                    show_dataframe(throughput(df, freq))
+                    
+                    st.subheader("استخدام المركبات")
+                    show_dataframe(vehicle_utilisation(df))
+            except Exception as e:
+                st.error(f"حدث خطأ أثناء حساب الإحصائيات: {e}")
+        
+        if st.button("🔙 رجوع"):
+            st.session_state.page = "home"
+            st.rerun()
+
+    # -------------------- Performance Page --------------------
+    elif st.session_state.page == "profiling":
+        st.title("⏱️ أداء التطبيق")
+        if st.session_state.role != ROLES["admin"]:
+            st.warning("هذه الصفحة متاحة للمسؤول فقط.")
+        else:
+            profiler = get_profiler()
+            if not profiler.enabled:
+                st.info("قياس الأداء متوقف (EVALUATION_PROFILING=0).")
+            samples = profiler.samples()
+            st.write(f"عدد القياسات: {len(samples)}")
+            
+            st.subheader("ملخص حسب الصفحة والعملية")
+            st.dataframe(profiler.summary())
+            
+            cache = get_report_cache().stats()
+            st.write(
+                f"ذاكرة صفحات التقارير: {cache['entries']} صفحة، {cache['bytes'] / 1024 / 1024:.1f} ميغابايت، "
+                f"{cache['hits']} إصابة و {cache['misses']} إخفاق"
+            )
+            
+            st.subheader("آخر القياسات")
+            st.dataframe(samples.tail(200).iloc[::-1])
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button("⬇️ تحميل القياسات (JSON)", samples.to_json(orient="records", lines=True, force_ascii=False), file_name="profile.jsonl", mime="application/json")
+            with col2:
+                if st.button("🧹 مسح القياسات"):
+                    profiler.clear()
+                    st.rerun()
+        
+        if st.button("🔙 رجوع"):
+            st.session_state.page = "home"
+            st.rerun()
+
 # ------------------------------
 # Run the application
 # ------------------------------
 if __name__ == "__main__":
-    main()
+    with get_profiler().rerun(st.session_state.get("page", "login")):
+        main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Summary table of the reports, kept up to date as reports are saved and deleted.
+
+One row per evaluator, vehicle and local day holds the number of reports,
+how many of them recorded each error, and the time of the latest activity.
+The storage backends add the summary of every batch of saved reports and
+subtract the summary of deleted ones in the same write, so dashboards read
+a table whose size depends on the number of evaluators, vehicles and days,
+not on the number of reports.
+
+`last activity` is not moved back when a report is deleted; rebuilding the
+summary from the reports (`python storage.py rebuild-summary`) recomputes it.
+"""
+import numpy as np
+import pandas as pd
+
+from error_codes import ERROR_NAMES, error_masks, mask_bits
+from timestamps import to_local
+
+# Columns identifying a summary row
+SUMMARY_KEYS = ["اسم المستخدم", "رقم المركبة", "اليوم"]
+REPORTS_COUNT_COLUMN = "عدد التقارير"
+LAST_ACTIVITY_COLUMN = "آخر نشاط"
+# Counts per error are stored in ERROR_NAMES order
+SUMMARY_COLUMNS = SUMMARY_KEYS + [REPORTS_COUNT_COLUMN] + ERROR_NAMES + [LAST_ACTIVITY_COLUMN]
+COUNT_COLUMNS = [REPORTS_COUNT_COLUMN] + ERROR_NAMES
+
+
+def empty_summary():
+    return pd.DataFrame(columns=SUMMARY_COLUMNS).astype({col: "int64" for col in COUNT_COLUMNS})
+
+
+def summarize_reports(df):
+    """
+    Returns the summary rows of a reports DataFrame with typed times (as
+    returned by the storage backends), one per evaluator, vehicle and day.
+    """
+    if df.empty:
+        return empty_summary()
+    bits = mask_bits(error_masks(df)).astype(np.int64)
+    start = pd.Series(df["وقت البداية"], dtype="Int64").reset_index(drop=True)
+    end = pd.Series(df["وقت النهاية"], dtype="Int64").reset_index(drop=True)
+    rows = pd.DataFrame(bits, columns=ERROR_NAMES)
+    rows.insert(0, REPORTS_COUNT_COLUMN, 1)
+    rows.insert(0, "اليوم", to_local(start).dt.strftime("%Y-%m-%d").fillna(""))
+    rows.insert(0, "رقم المركبة", df["رقم المركبة"].fillna("").astype(str).to_numpy())
+    rows.insert(0, "اسم المستخدم", df["اسم المستخدم"].fillna("").astype(str).to_numpy())
+    rows[LAST_ACTIVITY_COLUMN] = end.fillna(start).astype("float64")
+    grouped = rows.groupby(SUMMARY_KEYS, sort=False)
+    summary = grouped[COUNT_COLUMNS].sum()
+    summary[LAST_ACTIVITY_COLUMN] = grouped[LAST_ACTIVITY_COLUMN].max().astype("Int64")
+    return summary.reset_index()[SUMMARY_COLUMNS]
+
+
+def _by_key(summary):
+    """Returns summary rows indexed by SUMMARY_KEYS, with the rows of a repeated key merged into one."""
+    grouped = summary.groupby(SUMMARY_KEYS, sort=False, dropna=False)
+    rows = grouped[COUNT_COLUMNS].sum()
+    rows[LAST_ACTIVITY_COLUMN] = grouped[LAST_ACTIVITY_COLUMN].max()
+    return rows
+
+
+def apply_summary(summary, delta, sign=1):
+    """
+    Adds (sign=1) or subtracts (sign=-1) summary rows to a summary table and
+    returns the result. `delta` may hold several rows for the same key, such
+    as the changes of several batches. Rows left without reports are dropped.
+    """
+    if delta.empty:
+        return summary
+    base = _by_key(summary)
+    change = _by_key(delta)
+    counts = base[COUNT_COLUMNS].add(change[COUNT_COLUMNS] * sign, fill_value=0).astype(np.int64)
+    last = base[LAST_ACTIVITY_COLUMN].astype("Float64")
+    if sign > 0:
+        last = pd.concat([last, change[LAST_ACTIVITY_COLUMN].astype("Float64")]).groupby(level=[0, 1, 2]).max()
+    counts[LAST_ACTIVITY_COLUMN] = last.reindex(counts.index).astype("Int64")
+    counts = counts[counts[REPORTS_COUNT_COLUMN] > 0]
+    return counts.reset_index()[SUMMARY_COLUMNS]
+
+
+def totals_by(summary, column):
+    """Report and error totals per value of one summary key, with the latest activity."""
+    grouped = summary.groupby(column)
+    totals = grouped[COUNT_COLUMNS].sum()
+    totals[LAST_ACTIVITY_COLUMN] = grouped[LAST_ACTIVITY_COLUMN].max()
+    return totals.sort_values(REPORTS_COUNT_COLUMN, ascending=False)
+
+
+def summaries_equal(a, b):
+    """True if two summary tables hold the same counts (row order does not matter)."""
+    def normalized(df):
+        return df[SUMMARY_KEYS + COUNT_COLUMNS].astype({col: "int64" for col in COUNT_COLUMNS}).sort_values(SUMMARY_KEYS).reset_index(drop=True)
+    return normalized(a).equals(normalized(b))
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import pytest
+
+# The app's modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import CsvBackend, SqliteBackend  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    """Runs every test in its own directory, where the default data and lock files are created."""
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def make_csv_backend(tmp_path):
+    """Returns a function creating CsvBackends on the same files in a temporary directory."""
+    def make():
+        return CsvBackend(
+            users_file=str(tmp_path / "users.csv"),
+            reports_file=str(tmp_path / "reports.csv"),
+            reports_journal=str(tmp_path / "reports.jsonl"),
+            fsync=False,
+            summary_file=str(tmp_path / "summary.csv"),
+            archive_dir=str(tmp_path / "archive"),
+            summary_journal=str(tmp_path / "summary.jsonl")
+        )
+    return make
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def make_backend(request, make_csv_backend, tmp_path):
+    """Like make_csv_backend, once for each storage backend."""
+    if request.param == "csv":
+        return make_csv_backend
+    return lambda: SqliteBackend(str(tmp_path / "evaluation.db"), str(tmp_path / "archive"))
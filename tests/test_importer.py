@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from config import REPORT_ID_COLUMN, SOURCE_ID_COLUMN
+from importer import import_file
+
+
+def _dump(path, rows):
+    columns = [REPORT_ID_COLUMN, "اسم التقرير", "وقت البداية", "وقت النهاية", "الأخطاء", "اسم المستخدم", "رقم المركبة"]
+    pd.DataFrame([dict(zip(columns, row)) for row in rows], columns=columns).to_csv(path, index=False)
+    return str(path)
+
+
+def _import(storage, path, chunk_size=2):
+    return import_file(storage, "reports", path, chunk_size=chunk_size, progress=lambda line: None)
+
+
+def test_sites_numbering_from_one_do_not_collide(make_backend, tmp_path):
+    storage = make_backend()
+    storage.ensure_ready()
+    storage.append_report({"اسم التقرير": "here", "وقت البداية": "1790000000", "اسم المستخدم": "Ali"})
+    site_a = _dump(tmp_path / "a.csv", [("1", "a1", "1790000000", "", "", "Omar", "1"), ("2", "a2", "1790000100", "", "", "Omar", "1")])
+    site_b = _dump(tmp_path / "b.csv", [("1", "b1", "1790000000", "", "", "Sara", "2")])
+
+    assert _import(storage, site_a) == (2, 0)
+    assert _import(storage, site_b) == (1, 0)
+    # A dump imported again adds nothing
+    assert _import(storage, site_a) == (0, 2)
+    df = storage.load_reports()
+    assert sorted(df[REPORT_ID_COLUMN].astype(int)) == [1, 2, 3, 4]
+    assert set(zip(df["اسم المستخدم"], df[SOURCE_ID_COLUMN].fillna(""))) == {("Ali", ""), ("Omar", "1"), ("Omar", "2"), ("Sara", "1")}
+
+
+def test_rows_without_id_do_not_take_later_ids(make_backend, tmp_path):
+    storage = make_backend()
+    storage.ensure_ready()
+    dump = _dump(tmp_path / "dump.csv", [
+        ("", "no id", "1790000000", "", "", "Omar", "1"),
+        ("1", "first", "1790000100", "", "", "Omar", "1"),
+        ("1", "repeat", "1790000200", "", "", "Omar", "1"),
+        ("2", "second", "1790000300", "", "", "Omar", "1"),
+    ])
+
+    assert _import(storage, dump, chunk_size=1) == (3, 1)
+    assert sorted(storage.load_reports()["اسم التقرير"]) == ["first", "no id", "second"]
+    assert pd.read_csv(tmp_path / "dump.rejected.csv")["reason"].tolist() == ["report already imported"]
+
+
+def test_archived_imports_are_not_imported_again(make_backend, tmp_path):
+    storage = make_backend()
+    storage.ensure_ready()
+    dump = _dump(tmp_path / "dump.csv", [("7", "old", "1704067200", "", "حزام", "Omar", "1")])
+    assert _import(storage, dump) == (1, 0)
+    assert storage.archive_reports() == 1
+
+    assert _import(make_backend(), dump) == (0, 1)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from config import REPORT_ID_COLUMN
+from storage import ReportQuery
+from summaries import REPORTS_COUNT_COLUMN
+
+# reports.csv as written by the app before reports had IDs, error masks or epoch times
+BASELINE_REPORTS = (
+    "اسم التقرير,وقت البداية,وقت النهاية,الأخطاء,ملاحظات,اسم المستخدم,رقم المركبة\n"
+    "r1,2024-03-01 10:00,2024-03-01 10:30,حزام; سرعة,,Ali,7\n"
+    "r2,2024-03-02 09:00,2024-03-02 09:45,,ملاحظة,hus585,3\n"
+)
+
+
+def test_starts_on_baseline_reports_file(make_csv_backend, tmp_path):
+    (tmp_path / "reports.csv").write_text(BASELINE_REPORTS, encoding="utf-8")
+    storage = make_csv_backend()
+    storage.ensure_ready()
+
+    df, total = storage.query_reports(ReportQuery(sort_by=REPORT_ID_COLUMN, descending=False))
+    assert total == 2
+    assert list(df[REPORT_ID_COLUMN]) == ["1", "2"]
+    assert list(df["اسم التقرير"]) == ["r1", "r2"]
+    assert int(storage.load_summary()[REPORTS_COUNT_COLUMN].sum()) == 2
+
+    # The rewritten file is in the current format, so a restart changes nothing
+    restarted = make_csv_backend()
+    restarted.ensure_ready()
+    assert restarted.append_report({"اسم التقرير": "r3", "وقت البداية": "1790000000", "اسم المستخدم": "Ali"}) == 3
+    assert restarted.rebuild_summary()
+
+
+def test_summary_journal_replay_merges_rows_of_the_same_day(make_csv_backend):
+    storage = make_csv_backend()
+    storage.ensure_ready()
+    report = {"اسم التقرير": "r", "وقت البداية": "1790000000", "وقت النهاية": "1790000600", "الأخطاء": "حزام", "اسم المستخدم": "Ali", "رقم المركبة": "7"}
+    storage.append_report(report)
+    storage.append_report(report)
+
+    # The restart replays both saves from the summary journal in one batch
+    restarted = make_csv_backend()
+    restarted.ensure_ready()
+    restarted.append_report(report)
+    summary = restarted.load_summary()
+    assert len(summary) == 1
+    assert int(summary[REPORTS_COUNT_COLUMN].sum()) == 3
+    assert restarted.rebuild_summary()
+
+
+def test_report_ids_are_not_reused_after_restart(make_backend):
+    storage = make_backend()
+    storage.ensure_ready()
+    report = {"اسم التقرير": "r", "وقت البداية": "1790000000", "اسم المستخدم": "Ali"}
+    assert storage.append_reports([report, report]) == [1, 2]
+    storage.delete_report(2)
+    storage.compact()
+
+    restarted = make_backend()
+    restarted.ensure_ready()
+    assert restarted.append_report(report) == 3
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Report timestamps.
+
+Start and end times are stored as whole seconds since the Unix epoch (UTC),
+so filters and durations are integer comparisons and subtractions. The local
+time zone `tz` is applied only when a time is shown to a person.
+
+Reports saved before this change hold "%Y-%m-%d %H:%M" strings in local
+time. `parse_times` accepts both forms, so those rows are read correctly
+until the storage backend rewrites them as epoch seconds (once, on start).
+"""
+import time
+from datetime import datetime, time as day_time, timedelta
+
+import pandas as pd
+
+from config import TIME_COLUMNS, tz
+
+# Format of the times stored before epoch seconds were used (local time)
+LEGACY_TIME_FORMAT = "%Y-%m-%d %H:%M"
+# Format times are shown in
+DISPLAY_FORMAT = "%Y-%m-%d %H:%M"
+
+_EPOCH = pd.Timestamp("1970-01-01", tz="UTC")
+
+
+def now_epoch():
+    """Returns the current time in epoch seconds."""
+    return int(time.time())
+
+
+def parse_times(values):
+    """
+    Vectorized conversion of stored times (epoch seconds, as numbers or
+    strings, or legacy local-time strings) into a nullable Int64 Series.
+    """
+    values = pd.Series(values)
+    epochs = pd.to_numeric(values, errors="coerce")
+    legacy = epochs.isna() & values.notna() & (values.astype(str) != "")
+    if legacy.any():
+        local = pd.to_datetime(values[legacy].astype(str), format=LEGACY_TIME_FORMAT, errors="coerce")
+        local = local.dt.tz_localize(tz, ambiguous="NaT", nonexistent="NaT")
+        epochs[legacy] = (local - _EPOCH) // pd.Timedelta(seconds=1)
+    return epochs.round().astype("Int64")
+
+
+def has_legacy_times(values):
+    """True if any stored time is still a legacy local-time string."""
+    values = pd.Series(values).dropna().astype(str)
+    values = values[values != ""]
+    return bool(pd.to_numeric(values, errors="coerce").isna().any())
+
+
+def to_local(epochs):
+    """Returns epoch seconds as timezone-aware local datetimes (NaT where missing)."""
+    return pd.to_datetime(pd.Series(epochs, dtype="Int64").astype("float64"), unit="s", utc=True).dt.tz_convert(tz)
+
+
+def format_times(epochs):
+    """Formats epoch times for display in local time; empty where missing."""
+    return to_local(epochs).dt.strftime(DISPLAY_FORMAT).fillna("")
+
+
+def with_local_times(df, columns=TIME_COLUMNS):
+    """Returns a copy of a DataFrame with its time columns formatted in local time."""
+    df = df.copy()
+    for col in columns:
+        if col in df:
+            df[col] = format_times(df[col]).to_numpy()
+    return df
+
+
+def local_day_start(day):
+    """Returns the epoch seconds at which a local calendar day starts."""
+    return int(tz.localize(datetime.combine(day, day_time.min)).timestamp())
+
+
+def local_day_end(day):
+    """Returns the epoch seconds at which a local calendar day ends (exclusive)."""
+    return local_day_start(day + timedelta(days=1))
+
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory index of users keyed by normalized username.
+
+The index is rebuilt from the storage backend only when its `users_version()`
+token changes, so logins and duplicate-username checks are dictionary lookups
+instead of a full read of the users file on every click.
+"""
+import threading
+
+import pandas as pd
+
+from config import USERS_COLUMNS
+
+
+def normalize_username(username):
+    """Usernames are matched ignoring surrounding spaces and letter case."""
+    return str(username).strip().lower()
+
+
+class UserIndex:
+    """Process-wide cache of the users table, safe to share between sessions."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._lock = threading.Lock()
+        self._version = None
+        self._users = {}
+        self._frame = pd.DataFrame(columns=USERS_COLUMNS)
+
+    def _refresh(self):
+        version = self.storage.users_version()
+        if version == self._version:
+            return
+        with self._lock:
+            # Another session may have rebuilt the index while we waited for the lock
+            if version == self._version:
+                return
+            users = {}
+            for user in self.storage.list_users().to_dict("records"):
+                user = {col: str(value).strip() for col, value in user.items()}
+                # Keep the first row for a username, like the original CSV lookup did
+                users.setdefault(normalize_username(user["username"]), user)
+            self._users = users
+            self._frame = pd.DataFrame(list(users.values()), columns=USERS_COLUMNS)
+            self._version = version
+
+    def get(self, username):
+        """Returns the user dict for `username`, or None if there is no such user."""
+        self._refresh()
+        return self._users.get(normalize_username(username))
+
+    def frame(self):
+        """Returns all users, one row per username, as a DataFrame with USERS_COLUMNS. Do not modify it."""
+        self._refresh()
+        return self._frame
+
+    def __contains__(self, username):
+        return self.get(username) is not None
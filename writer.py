@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Single writer for the storage backend.
+
+Streamlit runs every session in its own thread. Instead of each session doing
+its own read-modify-write of the shared files, all writes are queued to one
+writer thread. Whatever piles up while the previous commit is running is
+applied as one group commit: one journal append for all new reports, one
+users write for all registrations and one for all account updates.
+
+Each call returns a `concurrent.futures.Future` that is resolved once the
+batch containing it has been written. When the backend reports that enough
+reports were deleted or appended, a compaction is queued behind the batch
+so it runs on the writer thread instead of in a user's request. In the same
+way, at most once every ARCHIVE_CHECK_INTERVAL seconds the writer checks for
+reports of closed months and queues an archive run (see archive.py).
+
+A failing write fails only the futures of its batch: the writer thread logs
+the error and carries on with the next batch.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from config import ARCHIVE_CHECK_INTERVAL, COMMIT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class _Op:
+    """One queued write: its kind, its payload and the caller's future."""
+
+    __slots__ = ("kind", "payload", "future")
+
+    def __init__(self, kind, payload):
+        self.kind = kind
+        self.payload = payload
+        self.future = Future()
+
+
+class CommitQueue:
+    """Process-wide writer thread that batches concurrent writes."""
+
+    def __init__(self, storage, max_batch=COMMIT_BATCH_SIZE):
+        self.storage = storage
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._compaction_queued = False
+        self._archive_queued = False
+        self._archive_checked = time.monotonic() - ARCHIVE_CHECK_INTERVAL
+        self._thread = threading.Thread(target=self._run, name="commit-queue", daemon=True)
+        self._thread.start()
+
+    # ------------------------------
+    # Public API
+    # ------------------------------
+    def _submit(self, kind, payload):
+        op = _Op(kind, payload)
+        self._queue.put(op)
+        return op.future
+
+    def append_report(self, report):
+        """Queues a new report. The future resolves to the report's ID."""
+        return self._submit("report", report)
+
+    def add_user(self, user):
+        """Queues a registration. The future resolves to False if the username is taken."""
+        return self._submit("user", user)
+
+    def update_users(self, changes):
+        """Queues user changes ({username: {column: value}}). The future resolves to None."""
+        return self._submit("update", changes)
+
+    def delete_report(self, report_id):
+        """Queues the deletion of the report with this ID. The future resolves to None."""
+        return self._submit("delete", report_id)
+
+    def compact(self):
+        """Queues a compaction of the reports store. The future resolves to None."""
+        self._compaction_queued = True
+        return self._submit("compact", None)
+
+    def archive(self):
+        """Queues moving the reports of closed months into the archive. The future resolves to the number moved."""
+        self._archive_queued = True
+        return self._submit("archive", None)
+
+    # ------------------------------
+    # Writer thread
+    # ------------------------------
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Everything queued while the previous commit was running goes into this one
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._commit(batch)
+            except Exception as e:
+                # The thread must survive, or every later write would wait until COMMIT_TIMEOUT
+                logger.exception("Commit of %d queued writes failed", len(batch))
+                for op in batch:
+                    if not op.future.done():
+                        op.future.set_exception(e)
+
+    def _commit(self, batch):
+        # A compaction or an archive run rewrites the reports, so it runs on its
+        # own and in order; the writes queued around it are grouped on either side
+        group = []
+        for op in batch:
+            if op.kind == "compact":
+                self._commit_group(group)
+                group = []
+                self._compaction_queued = False
+                self._apply([op], lambda ops: self.storage.compact())
+            elif op.kind == "archive":
+                self._commit_group(group)
+                group = []
+                self._archive_queued = False
+                self._apply([op], lambda ops: [self.storage.archive_reports()])
+                # The moved reports are tombstones in an append-only store
+                self._check_maintenance(compaction=True, archive=False)
+            else:
+                group.append(op)
+        self._commit_group(group)
+
+    def _commit_group(self, ops):
+        users = [op for op in ops if op.kind == "user"]
+        updates = [op for op in ops if op.kind == "update"]
+        reports = [op for op in ops if op.kind == "report"]
+        deletes = [op for op in ops if op.kind == "delete"]
+        if users:
+            self._apply(users, lambda ops: self.storage.add_users([op.payload for op in ops]))
+        if updates:
+            self._apply(updates, self._merge_updates)
+        if reports:
+            self._apply(reports, lambda ops: self.storage.append_reports([op.payload for op in ops]))
+        if deletes:
+            self._apply(deletes, lambda ops: self.storage.delete_reports([op.payload for op in ops]))
+        self._check_maintenance(compaction=bool(reports or deletes), archive=bool(reports))
+
+    def _check_maintenance(self, compaction, archive):
+        """
+        Queues a compaction or an archive run when the backend needs one. The
+        checks read the store, so a failure is logged instead of stopping the writer.
+        """
+        try:
+            if compaction and not self._compaction_queued and self.storage.needs_compaction():
+                self.compact()
+            if archive and not self._archive_queued and time.monotonic() - self._archive_checked > ARCHIVE_CHECK_INTERVAL:
+                self._archive_checked = time.monotonic()
+                if self.storage.needs_archive():
+                    self.archive()
+        except Exception:
+            logger.exception("Checking whether the reports store needs maintenance failed")
+
+    def _merge_updates(self, ops):
+        # Later changes to the same user and column win, as if applied one by one
+        merged = {}
+        for op in ops:
+            for username, fields in op.payload.items():
+                merged.setdefault(username, {}).update(fields)
+        self.storage.update_users(merged)
+
+    @staticmethod
+    def _apply(ops, write):
+        """
+        Runs one write for a group of ops and resolves their futures. A list
+        result is handed out one item per op; anything else resolves to None.
+        """
+        try:
+            result = write(ops)
+        except Exception as e:
+            for op in ops:
+                op.future.set_exception(e)
+            return
+        for i, op in enumerate(ops):
+            op.future.set_result(result[i] if isinstance(result, list) else None)